@@ -7,6 +7,21 @@ import asyncio
 import subprocess
 import sys
 
+# StreamReader 기본 limit(64KiB)보다 큰 버퍼로 읽기 위한 설정
+STREAM_LIMIT = 1024 * 1024
+
+
+def _enlarge_pipe(process):
+    """Linux에서 커널 파이프 버퍼를 키워 컨텍스트 스위치를 줄임 (실패해도 무시)"""
+    if sys.platform != 'linux':
+        return
+    try:
+        import fcntl
+        pipe = process.stdout._transport.get_extra_info('pipe')
+        fcntl.fcntl(pipe.fileno(), fcntl.F_SETPIPE_SZ, 1 << 20)
+    except Exception:
+        pass
+
 async def test_claude_cli_direct():
     """Claude CLI를 직접 테스트"""
     print("=== Claude CLI 직접 테스트 ===")
@@ -21,9 +36,11 @@ async def test_claude_cli_direct():
             *cmd,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
-            cwd="."
+            cwd=".",
+            limit=STREAM_LIMIT
         )
-        
+        _enlarge_pipe(process)
+
         print("프로세스 시작됨, 출력 대기 중...")
         
         # stdout 읽기
@@ -55,19 +72,23 @@ async def test_claude_version():
     print("\n=== Claude 버전 확인 ===")
     
     try:
-        # 버전 확인
-        result = subprocess.run(['claude', '--version'], 
-                              capture_output=True, text=True, timeout=10)
-        
-        print(f"Return code: {result.returncode}")
-        if result.returncode == 0:
-            print(f"Claude 버전: {result.stdout.strip()}")
+        # 버전 확인 (블로킹 subprocess.run 대신 비동기 실행으로 이벤트 루프 유지)
+        process = await asyncio.create_subprocess_exec(
+            'claude', '--version',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout_data, stderr_data = await asyncio.wait_for(process.communicate(), 10)
+
+        print(f"Return code: {process.returncode}")
+        if process.returncode == 0:
+            print(f"Claude 버전: {stdout_data.decode('utf-8', errors='ignore').strip()}")
         else:
-            print(f"에러: {result.stderr}")
-            
+            print(f"에러: {stderr_data.decode('utf-8', errors='ignore')}")
+
     except FileNotFoundError:
         print("❌ claude 명령어를 찾을 수 없습니다.")
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         print("❌ 타임아웃")
     except Exception as e:
         print(f"❌ 에러: {e}")
@@ -77,13 +98,17 @@ async def test_claude_help():
     print("\n=== Claude 도움말 확인 ===")
     
     try:
-        # 도움말 확인
-        result = subprocess.run(['claude', '--help'], 
-                              capture_output=True, text=True, timeout=10)
-        
-        print(f"Return code: {result.returncode}")
-        if result.returncode == 0:
-            help_text = result.stdout.strip()
+        # 도움말 확인 (블로킹 subprocess.run 대신 비동기 실행)
+        process = await asyncio.create_subprocess_exec(
+            'claude', '--help',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout_data, stderr_data = await asyncio.wait_for(process.communicate(), 10)
+
+        print(f"Return code: {process.returncode}")
+        if process.returncode == 0:
+            help_text = stdout_data.decode('utf-8', errors='ignore').strip()
             print(f"도움말 (첫 500자):")
             print(help_text[:500])
             
@@ -93,8 +118,8 @@ async def test_claude_help():
             else:
                 print("⚠️ -p/--print 옵션을 찾을 수 없음")
         else:
-            print(f"에러: {result.stderr}")
-            
+            print(f"에러: {stderr_data.decode('utf-8', errors='ignore')}")
+
     except Exception as e:
         print(f"❌ 에러: {e}")
 
@@ -110,27 +135,42 @@ async def test_claude_streaming():
             *cmd,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
-            cwd="."
+            cwd=".",
+            limit=STREAM_LIMIT
         )
-        
+        _enlarge_pipe(process)
+
         print("실시간 출력:")
-        
-        # 실시간으로 stdout 읽기
+
+        # 실시간으로 stdout 읽기 (라인 단위 readline 대신 큰 청크로 읽어서
+        # 이벤트 루프 웨이크업 횟수를 줄임 - 표시용 라인 분리는 파이썬에서 처리)
         line_count = 0
+        buffer = bytearray()
         while True:
             try:
-                line = await asyncio.wait_for(process.stdout.readline(), timeout=5.0)
-                if not line:
+                chunk = await asyncio.wait_for(process.stdout.read(65536), timeout=5.0)
+                if not chunk:
                     break
-                
-                line_count += 1
-                text = line.decode('utf-8', errors='ignore').strip()
-                if text:
-                    print(f"  {line_count}: {text}")
-                    
+
+                buffer += chunk
+                while b'\n' in buffer:
+                    line, _, rest = buffer.partition(b'\n')
+                    buffer = bytearray(rest)
+                    line_count += 1
+                    text = line.decode('utf-8', errors='ignore').strip()
+                    if text:
+                        print(f"  {line_count}: {text}")
+
             except asyncio.TimeoutError:
-                print("  (1초 타임아웃)")
+                print("  (5초 타임아웃)")
                 break
+
+        # 개행 없이 남은 출력 처리
+        if buffer:
+            text = buffer.decode('utf-8', errors='ignore').strip()
+            if text:
+                line_count += 1
+                print(f"  {line_count}: {text}")
         
         # 프로세스 완료 대기
         return_code = await process.wait()
@@ -149,9 +189,10 @@ async def test_claude_streaming():
 async def main():
     """메인 함수"""
     print("Claude CLI 디버그 테스트 시작\n")
-    
-    await test_claude_version()
-    await test_claude_help()
+
+    # 버전/도움말 프로브는 독립적이므로 동시에 실행
+    await asyncio.gather(test_claude_version(), test_claude_help())
+    # 스트리밍 테스트들은 출력이 섞이지 않도록 순차 실행
     await test_claude_cli_direct()
     await test_claude_streaming()
     
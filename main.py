@@ -14,29 +14,58 @@ import argparse
 import logging
 import os
 import sys
-from multiprocessing import Process
-from dotenv import load_dotenv
+
+# uvloop이 설치되어 있으면 기본 이벤트 루프로 사용 (Windows 미지원)
+try:
+    if sys.platform != "win32":
+        import uvloop
+        uvloop.install()
+    else:
+        uvloop = None
+except ImportError:
+    uvloop = None
 
 # 프로젝트 루트를 Python 경로에 추가
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
+from src.settings import settings
 from src.agent_server import app as agent_app
 from src.telegram_bridge import TelegramBridge
 
-load_dotenv()
-
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'  # 날짜/밀리초 포맷 연산 생략
 )
 logger = logging.getLogger(__name__)
 
 def run_agent_server():
     """Agent Server 실행"""
     import uvicorn
-    port = int(os.getenv('EXECUTOR_PORT', 8001))
-    logger.info(f"Starting Agent Server on port {port}")
-    uvicorn.run(agent_app, host="0.0.0.0", port=port, log_level="info")
+    port = settings.executor_port
+    workers = int(os.getenv('UVICORN_WORKERS', 1))
+    logger.info(f"Starting Agent Server on port {port} ({workers} worker(s))")
+
+    if workers > 1:
+        # SO_REUSEPORT prefork 스케일아웃 - 멀티 워커는 임포트 문자열이 필요.
+        # 세션 상태가 워커 로컬이므로 세션 어피니티가 보장되는 환경에서만 사용.
+        uvicorn.run(
+            "src.agent_server:app",
+            host="0.0.0.0",
+            port=port,
+            log_level="info",
+            workers=workers,
+            loop="uvloop" if uvloop else "auto",
+            http="auto"
+        )
+    else:
+        uvicorn.run(
+            agent_app,
+            host="0.0.0.0",
+            port=port,
+            log_level="info",
+            loop="uvloop" if uvloop else "auto"
+        )
 
 async def run_telegram_bridge():
     """Telegram Bridge 실행"""
@@ -44,9 +73,28 @@ async def run_telegram_bridge():
     bridge = TelegramBridge()
     await bridge.run()
 
-def run_bridge_process():
-    """Telegram Bridge를 별도 프로세스에서 실행"""
-    asyncio.run(run_telegram_bridge())
+async def run_both():
+    """Agent Server와 Telegram Bridge를 하나의 이벤트 루프에서 실행
+
+    별도 프로세스 fork 없이 uvicorn.Server를 태스크로 돌려서
+    메모리 중복과 종료 시 terminate() 경쟁을 제거한다.
+    """
+    import uvicorn
+    port = settings.executor_port
+    config = uvicorn.Config(
+        agent_app,
+        host="0.0.0.0",
+        port=port,
+        log_level="info",
+        loop="uvloop" if uvloop else "auto"
+    )
+    server = uvicorn.Server(config)
+
+    try:
+        await asyncio.gather(server.serve(), run_telegram_bridge())
+    finally:
+        # 어느 한쪽이 먼저 끝나도 서버는 정상 종료
+        server.should_exit = True
 
 def main():
     parser = argparse.ArgumentParser(description="Remote Agent System")
@@ -60,11 +108,8 @@ def main():
     args = parser.parse_args()
     
     # 환경 변수 검증
-    required_env_vars = ['TELEGRAM_BOT_TOKEN']
-    missing_vars = [var for var in required_env_vars if not os.getenv(var)]
-    
-    if missing_vars:
-        logger.error(f"다음 환경 변수가 필요합니다: {', '.join(missing_vars)}")
+    if not settings.telegram_bot_token:
+        logger.error("다음 환경 변수가 필요합니다: TELEGRAM_BOT_TOKEN")
         logger.error("'.env' 파일을 생성하고 필요한 값들을 설정해주세요.")
         sys.exit(1)
     
@@ -79,25 +124,13 @@ def main():
         asyncio.run(run_telegram_bridge())
         
     elif args.mode == "both":
-        # 둘 다 실행 (별도 프로세스)
+        # 둘 다 실행 (단일 프로세스, 이벤트 루프 공유)
         try:
-            # Agent Server를 별도 프로세스에서 실행
-            server_process = Process(target=run_agent_server)
-            server_process.start()
-            
-            # Telegram Bridge를 메인 프로세스에서 실행
-            asyncio.run(run_telegram_bridge())
-            
+            asyncio.run(run_both())
         except KeyboardInterrupt:
             logger.info("Shutting down...")
-            if 'server_process' in locals():
-                server_process.terminate()
-                server_process.join()
         except Exception as e:
             logger.error(f"Error running system: {e}")
-            if 'server_process' in locals():
-                server_process.terminate()
-                server_process.join()
             sys.exit(1)
 
 if __name__ == "__main__":
@@ -1,12 +1,12 @@
-from fastapi import FastAPI, WebSocket, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, WebSocket, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
 import asyncio
 import json
 import logging
+import orjson
 import os
-from dotenv import load_dotenv
 
 from agent_system import (
     AgentManager, AgentType, AgentConfig, 
@@ -14,15 +14,23 @@ from agent_system import (
 )
 from persistent_claude_agent import PersistentClaudeAgent
 from pty_claude_agent import PTYClaudeAgent
+from config import config
+from settings import settings
 import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from src.config import config
-
-load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# 문자열 -> AgentType 변환 테이블 (요청마다 Enum을 순회하지 않도록 미리 구성)
+AGENT_TYPE_BY_VALUE = {at.value: at for at in AgentType}
+
+# SSE 배치 플러시 기준: 버퍼가 이 크기를 넘거나, 유휴 시간이 지나면 전송
+SSE_FLUSH_BYTES = 16 * 1024
+SSE_FLUSH_IDLE = 0.005
+
+# SSE 프레임 구성 상수 (프레임마다 리터럴을 새로 만들지 않음)
+SSE_PREFIX = b"data: "
+SSE_SUFFIX = b"\n\n"
+
 # Pydantic 모델들
 class CreateSessionRequest(BaseModel):
     agent_type: str
@@ -33,6 +41,9 @@ class ExecuteCommandRequest(BaseModel):
     session_id: str
     message: str
 
+class WSCommand(BaseModel):
+    message: str = ""
+
 class RegisterAgentRequest(BaseModel):
     agent_type: str
     executable_path: str
@@ -52,17 +63,17 @@ class AgentServer:
         # Claude Code 에이전트 (지속적인 세션)
         claude_config = AgentConfig(
             agent_type=AgentType.CLAUDE_CODE,
-            executable_path=os.getenv('CLAUDE_CODE_PATH', 'claude'),
+            executable_path=settings.claude_code_path,
             default_args=[],
-            timeout=int(os.getenv('SESSION_TIMEOUT', 3600)),
-            max_sessions=int(os.getenv('MAX_SESSIONS', 10)),
+            timeout=settings.session_timeout,
+            max_sessions=settings.max_sessions,
             stream_format='stream-json'
         )
         claude_agent = PTYClaudeAgent(claude_config)
         self.agent_manager.register_agent(AgentType.CLAUDE_CODE, claude_agent)
-        
+
         # Gemini CLI 에이전트 (예시 - 실제 경로는 환경에 따라 다름)
-        gemini_path = os.getenv('GEMINI_CLI_PATH')
+        gemini_path = settings.gemini_cli_path
         if gemini_path and os.path.exists(gemini_path):
             gemini_config = AgentConfig(
                 agent_type=AgentType.GEMINI_CLI,
@@ -76,9 +87,25 @@ class AgentServer:
             self.agent_manager.register_agent(AgentType.GEMINI_CLI, gemini_agent)
 
 # FastAPI 앱 설정
-app = FastAPI(title="Agent Server API", version="1.0.0")
+app = FastAPI(title="Agent Server API", version="1.0.0", default_response_class=ORJSONResponse)
 server = AgentServer()
 
+@app.on_event("startup")
+async def prewarm_agents():
+    """웜 풀이 설정된 에이전트의 Claude 프로세스를 미리 띄움"""
+    claude_agent = server.agent_manager.agents.get(AgentType.CLAUDE_CODE)
+    if claude_agent is not None and getattr(claude_agent, 'warm_pool_size', 0) > 0:
+        await claude_agent.prewarm()
+
+@app.on_event("shutdown")
+async def shutdown_agents():
+    """서버 종료 시 모든 세션과 자식 프로세스를 정리
+
+    프로세스를 그냥 terminate하면 PTY와 Claude CLI 자식이 고아로 남아
+    fd를 점유하므로, uvicorn의 셧다운 라이프사이클에서 정리한다.
+    """
+    await server.agent_manager.terminate_all_sessions()
+
 @app.get("/")
 async def root():
     return {"message": "Agent Server is running", "version": "1.0.0"}
@@ -115,7 +142,7 @@ async def register_custom_agent(request: RegisterAgentRequest):
         
         # 에이전트 타입을 동적으로 생성 (에이전트 이름 기반)
         agent_name = f"custom_{request.agent_type}"
-        custom_agent_type = AgentType(agent_name) if hasattr(AgentType, agent_name) else AgentType.CUSTOM
+        custom_agent_type = AGENT_TYPE_BY_VALUE.get(agent_name, AgentType.CUSTOM)
         
         server.agent_manager.register_agent(custom_agent_type, custom_agent)
         
@@ -131,12 +158,8 @@ async def create_session(request: CreateSessionRequest):
     """새 세션 생성"""
     try:
         # 문자열을 AgentType으로 변환
-        agent_type = None
-        for at in AgentType:
-            if at.value == request.agent_type:
-                agent_type = at
-                break
-        
+        agent_type = AGENT_TYPE_BY_VALUE.get(request.agent_type)
+
         if agent_type is None:
             raise HTTPException(status_code=400, detail=f"Unknown agent type: {request.agent_type}")
         
@@ -176,16 +199,71 @@ async def list_sessions(user_id: Optional[str] = None):
     """세션 목록 조회"""
     return await server.agent_manager.list_all_sessions(user_id)
 
-@app.post("/execute")
-async def execute_command(request: ExecuteCommandRequest):
+async def parse_execute_body(raw_request: Request) -> ExecuteCommandRequest:
+    """/execute 본문을 orjson으로 원시 바이트에서 직접 디코드
+
+    핫 엔드포인트라 FastAPI의 기본 본문 파싱 경로 대신
+    C 구현 디코더를 거쳐 모델을 만든다.
+    """
+    try:
+        return ExecuteCommandRequest(**orjson.loads(await raw_request.body()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=422, detail="Invalid request body")
+
+@app.post("/execute", response_model=None)
+async def execute_command(request: ExecuteCommandRequest = Depends(parse_execute_body)):
     """명령 실행 (스트리밍)"""
     async def generate():
+        # orjson은 bytes를 반환하므로 프레임 전체를 bytes로 조립해 인코딩을 생략.
+        # 작은 이벤트가 연달아 나올 때 프레임마다 전송하지 않고,
+        # SSE_FLUSH_BYTES를 넘거나 SSE_FLUSH_IDLE 동안 유휴면 묶어서 전송한다.
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump():
+            # 프레임마다 전역/속성 조회를 하지 않도록 핫 네임을 로컬에 바인딩
+            dumps = orjson.dumps
+            put = queue.put
+            prefix, suffix = SSE_PREFIX, SSE_SUFFIX
+            try:
+                async for output in server.agent_manager.execute_command(request.session_id, request.message):
+                    # 에이전트가 미리 직렬화한 JSON bytes를 주면 재인코딩 없이 전달
+                    if not isinstance(output, (bytes, bytearray)):
+                        output = dumps(output)
+                    await put(prefix + output + suffix)
+            except Exception as e:
+                logger.error("Error in execute_command: %s", e)
+                await put(prefix + dumps({"error": str(e)}) + suffix)
+            finally:
+                await put(None)
+
+        pump_task = asyncio.create_task(pump())
+        buffer = bytearray()
+
         try:
-            async for output in server.agent_manager.execute_command(request.session_id, request.message):
-                yield f"data: {json.dumps(output)}\n\n"
-        except Exception as e:
-            logger.error(f"Error in execute_command: {e}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            while True:
+                try:
+                    if buffer:
+                        frame = await asyncio.wait_for(queue.get(), timeout=SSE_FLUSH_IDLE)
+                    else:
+                        frame = await queue.get()
+                except asyncio.TimeoutError:
+                    # 새 이벤트가 없으면 모아둔 버퍼를 바로 내보내 지연을 제한
+                    yield bytes(buffer)
+                    buffer.clear()
+                    continue
+
+                if frame is None:
+                    break
+
+                buffer += frame
+                if len(buffer) >= SSE_FLUSH_BYTES:
+                    yield bytes(buffer)
+                    buffer.clear()
+
+            if buffer:
+                yield bytes(buffer)
+        finally:
+            pump_task.cancel()
     
     return StreamingResponse(generate(), media_type="text/event-stream")
 
@@ -196,26 +274,29 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     
     try:
         while True:
-            # 클라이언트로부터 메시지 받기
-            data = await websocket.receive_text()
-            
+            # 클라이언트로부터 메시지 받기 (bytes로 받아 ASGI 쪽 UTF-8 디코드 생략)
+            data = await websocket.receive_bytes()
+
             try:
-                message_data = json.loads(data)
-                message = message_data.get("message", "")
-                
+                command = WSCommand(**orjson.loads(data))
+                message = command.message
+
                 if not message:
-                    await websocket.send_text(json.dumps({"error": "Empty message"}))
+                    await websocket.send_bytes(orjson.dumps({"error": "Empty message"}))
                     continue
-                
+
                 # 명령 실행 및 결과 스트리밍
                 async for output in server.agent_manager.execute_command(session_id, message):
-                    await websocket.send_text(json.dumps(output))
-                    
+                    # 에이전트가 미리 직렬화한 JSON bytes를 주면 재인코딩 없이 전달
+                    if not isinstance(output, (bytes, bytearray)):
+                        output = orjson.dumps(output)
+                    await websocket.send_bytes(output)
+
             except json.JSONDecodeError:
-                await websocket.send_text(json.dumps({"error": "Invalid JSON format"}))
+                await websocket.send_bytes(orjson.dumps({"error": "Invalid JSON format"}))
             except Exception as e:
-                logger.error(f"Error processing WebSocket message: {e}")
-                await websocket.send_text(json.dumps({"error": str(e)}))
+                logger.error("Error processing WebSocket message: %s", e)
+                await websocket.send_bytes(orjson.dumps({"error": str(e)}))
                 
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
@@ -227,13 +308,37 @@ async def health_check():
     """헬스 체크"""
     return {
         "status": "healthy",
-        "agents": len(server.agent_manager.agents),
-        "total_sessions": sum([
-            len(agent.sessions) for agent in server.agent_manager.agents.values()
-        ])
+        "agents": server.agent_manager.n_agents,
+        "total_sessions": server.agent_manager.total_sessions
     }
 
 if __name__ == "__main__":
     import uvicorn
-    port = int(os.getenv('EXECUTOR_PORT', 8001))
-    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
\ No newline at end of file
+
+    # uvloop이 설치되어 있으면 기본 이벤트 루프로 사용 (Windows 미지원)
+    try:
+        if sys.platform != "win32":
+            import uvloop
+            uvloop.install()
+        else:
+            uvloop = None
+    except ImportError:
+        uvloop = None
+
+    # AGENT_SERVER_SOCKET이 설정되면 유닉스 소켓으로도 수신
+    # (브리지가 같은 호스트에서 루프백 TCP 없이 접속)
+    if settings.agent_server_socket:
+        uvicorn.run(
+            app,
+            uds=settings.agent_server_socket,
+            log_level="info",
+            loop="uvloop" if uvloop else "auto"
+        )
+    else:
+        uvicorn.run(
+            app,
+            host="0.0.0.0",
+            port=settings.executor_port,
+            log_level="info",
+            loop="uvloop" if uvloop else "auto"
+        )
\ No newline at end of file
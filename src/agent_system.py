@@ -2,29 +2,52 @@ from abc import ABC, abstractmethod
 import asyncio
 import subprocess
 import json
+import orjson
+import shlex
 import uuid
 import logging
-import time
 from typing import Dict, Optional, AsyncGenerator, Any, List
+from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from enum import Enum
 import os
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from src.config import config
+import time
+from config import config
 
 logger = logging.getLogger(__name__)
 
+# 스트리밍 중 줄마다 datetime.now().isoformat()을 새로 만들지 않도록
+# 1초 단위로 ISO 문자열을 캐시 (타임스탬프는 초 정밀도면 충분)
+_last_ts_sec = 0
+_last_ts_iso = ""
+
+def iso_now() -> str:
+    """1초 단위로 캐시된 현재 시각의 ISO 문자열"""
+    global _last_ts_sec, _last_ts_iso
+    t = int(time.time())
+    if t != _last_ts_sec:
+        _last_ts_sec = t
+        _last_ts_iso = datetime.now().isoformat(timespec='seconds')
+    return _last_ts_iso
+
+# 서브프로세스 stdout 읽기 파라미터: 줄 단위 readline 대신 큰 청크로 읽고,
+# 큰 JSON 라인이 LimitOverrunError를 내지 않도록 StreamReader limit을 올림
+STREAM_READ_CHUNK = 65536
+STREAM_LIMIT = 1024 * 1024
+
+# 프로세스 시작 시의 작업 디렉토리 (서버는 중간에 chdir하지 않으므로
+# 핫 패스에서 매번 os.getcwd() 시스템 콜을 하지 않고 이 값을 쓴다)
+INITIAL_CWD = os.getcwd()
+
 class AgentType(Enum):
     CLAUDE_CODE = "claude_code"
     GEMINI_CLI = "gemini_cli"
     CUSTOM = "custom"
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AgentConfig:
-    """에이전트 설정"""
+    """에이전트 설정 (생성 후 변경 불가, slots로 인스턴스 경량화)"""
     agent_type: AgentType
     executable_path: str
     default_args: List[str]
@@ -32,6 +55,7 @@ class AgentConfig:
     timeout: int = 3600
     max_sessions: int = 5
     stream_format: str = "stream-json"  # 출력 형식
+    include_raw: bool = False  # 파싱된 원본 JSON을 "raw"로 같이 내보낼지 (디버깅용)
 
 @dataclass
 class Session:
@@ -50,7 +74,9 @@ class BaseAgent(ABC):
     def __init__(self, config: AgentConfig):
         self.config = config
         self.sessions: Dict[str, Session] = {}
-    
+        # 유저별 세션 인덱스 (삽입 순서 == 생성 순서라 가장 오래된 세션이 맨 앞)
+        self.user_sessions: Dict[str, Dict[str, Session]] = defaultdict(dict)
+
     @abstractmethod
     async def prepare_command(self, message: str, session: Session) -> List[str]:
         """실행할 명령어 준비"""
@@ -65,15 +91,15 @@ class BaseAgent(ABC):
         """새로운 세션 생성"""
         session_id = str(uuid.uuid4())
         
-        # 세션 수 제한 확인
-        user_sessions = [s for s in self.sessions.values() if s.user_id == user_id]
+        # 세션 수 제한 확인 (전체 세션 스캔 대신 유저별 인덱스 사용)
+        user_sessions = self.user_sessions[user_id]
         if len(user_sessions) >= self.config.max_sessions:
             # 가장 오래된 세션 제거
-            oldest_session = min(user_sessions, key=lambda s: s.created_at)
-            await self.terminate_session(oldest_session.id)
+            oldest_id = next(iter(user_sessions))
+            await self.terminate_session(oldest_id)
         
         if working_directory is None:
-            working_directory = self.config.working_directory or os.getcwd()
+            working_directory = self.config.working_directory or INITIAL_CWD
         
         session = Session(
             id=session_id,
@@ -86,17 +112,17 @@ class BaseAgent(ABC):
         )
         
         self.sessions[session_id] = session
+        user_sessions[session_id] = session
         logger.info(f"Session created: {session_id} for user {user_id} with agent {self.config.agent_type.value}")
         return session_id
     
     async def execute_command(self, session_id: str, message: str) -> AsyncGenerator[Dict[str, Any], None]:
         """명령 실행 및 스트리밍 출력"""
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if session is None:
             yield {"error": "Session not found", "session_id": session_id}
             return
-        
-        session = self.sessions[session_id]
-        
+
         try:
             # 명령어 준비
             cmd = await self.prepare_command(message, session)
@@ -109,20 +135,32 @@ class BaseAgent(ABC):
                     *cmd,
                     stdout=asyncio.subprocess.PIPE,
                     stderr=asyncio.subprocess.PIPE,
-                    cwd=session.working_directory
+                    cwd=session.working_directory,
+                    limit=STREAM_LIMIT
                 )
             
             session.process = process
             
             # 실시간 출력 스트리밍 (타임아웃 적용)
             logger.info(f"Starting output streaming for session {session_id}")
-            start_time = time.time()
             timeout = 300  # 5분 타임아웃
-            
-            while True:
-                try:
-                    # 타임아웃 체크
-                    if time.time() - start_time > timeout:
+
+            # 0.1초 폴링 대신 청크 읽기와 전체 데드라인을 함께 대기.
+            # readline() 대신 64KB 단위로 읽어 줄 분리는 파이썬 쪽 버퍼에서 처리
+            # (줄당 syscall 1회 -> 64KB당 1회)
+            read_task = asyncio.create_task(process.stdout.read(STREAM_READ_CHUNK))
+            timeout_task = asyncio.create_task(asyncio.sleep(timeout))
+            buf = bytearray()
+
+            try:
+                eof = False
+                while not eof:
+                    done, _ = await asyncio.wait(
+                        {read_task, timeout_task},
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+
+                    if timeout_task in done:
                         logger.warning(f"Session {session_id} timed out after {timeout} seconds")
                         process.terminate()
                         yield {
@@ -132,41 +170,59 @@ class BaseAgent(ABC):
                             "timeout": True
                         }
                         break
-                    
-                    # 0.1초 타임아웃으로 readline 시도
-                    line = await asyncio.wait_for(process.stdout.readline(), timeout=0.1)
-                    if not line:
-                        logger.info(f"Session {session_id}: No more output, breaking loop")
-                        break
-                    
-                    output = line.decode('utf-8').strip()
-                    if output:
-                        logger.debug(f"Session {session_id} output: {output[:100]}...")
-                        # 전체 출력을 로그에 출력 (디버깅용)
-                        logger.debug(f"Session {session_id} full output: {output}")
-                        parsed_output = await self.parse_output(output)
-                        parsed_output["session_id"] = session_id
-                        parsed_output["agent_type"] = session.agent_type.value
-                        
-                        # 에러가 포함된 출력인지 확인
-                        if parsed_output.get("is_error") or parsed_output.get("error"):
-                            logger.error(f"Session {session_id} received error output: {parsed_output}")
-                        
-                        yield parsed_output
-                        
-                except asyncio.TimeoutError:
-                    # readline 타임아웃 - 프로세스가 아직 실행 중인지 확인
-                    if process.returncode is not None:
-                        logger.info(f"Session {session_id}: Process finished during timeout")
+
+                    try:
+                        chunk = read_task.result()
+                    except Exception as e:
+                        logger.error(f"Session {session_id}: Unexpected error in output loop: {e}")
                         break
-                    continue
-                except UnicodeDecodeError as e:
-                    logger.warning(f"Session {session_id}: Unicode decode error: {e}")
-                    continue
-                except Exception as e:
-                    logger.error(f"Session {session_id}: Unexpected error in output loop: {e}")
-                    break
-            
+
+                    if chunk:
+                        buf += chunk
+                        # 다음 청크 읽기를 바로 예약 (데드라인 태스크는 그대로 유지)
+                        read_task = asyncio.create_task(process.stdout.read(STREAM_READ_CHUNK))
+                    else:
+                        eof = True
+                        logger.info(f"Session {session_id}: No more output, breaking loop")
+
+                    # 버퍼에서 완성된 줄들을 분리 (EOF면 남은 꼬리까지 처리)
+                    while buf:
+                        nl = buf.find(b'\n')
+                        if nl < 0:
+                            if not eof:
+                                break
+                            line = bytes(buf)
+                            buf.clear()
+                        else:
+                            line = bytes(buf[:nl])
+                            del buf[:nl + 1]
+
+                        try:
+                            # strip을 bytes 단계에서 해서 str 복사를 한 번 줄임
+                            output = line.strip().decode('utf-8')
+                        except UnicodeDecodeError as e:
+                            logger.warning(f"Session {session_id}: Unicode decode error: {e}")
+                            continue
+
+                        if output:
+                            # %-스타일 지연 포매팅: DEBUG가 꺼져 있으면 포맷 비용 0
+                            logger.debug("Session %s output: %.100s...", session_id, output)
+                            # 전체 출력을 로그에 출력 (디버깅용)
+                            logger.debug("Session %s full output: %s", session_id, output)
+                            parsed_output = await self.parse_output(output)
+                            parsed_output["session_id"] = session_id
+                            parsed_output["agent_type"] = session.agent_type.value
+
+                            # 에러가 포함된 출력인지 확인
+                            if parsed_output.get("is_error") or parsed_output.get("error"):
+                                logger.error("Session %s received error output: %s", session_id, parsed_output)
+
+                            yield parsed_output
+            finally:
+                for task in (read_task, timeout_task):
+                    if not task.done():
+                        task.cancel()
+
             # 프로세스 종료 대기
             await process.wait()
             
@@ -198,30 +254,41 @@ class BaseAgent(ABC):
     
     async def terminate_session(self, session_id: str) -> bool:
         """세션 종료"""
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if session is None:
             return False
-        
-        session = self.sessions[session_id]
-        
+
         if session.process and session.process.returncode is None:
             try:
                 session.process.terminate()
-                await asyncio.sleep(0.1)
-                if session.process.returncode is None:
+                try:
+                    # 무조건 100ms 자는 대신 종료를 기다리다가 타임아웃 시에만 kill
+                    await asyncio.wait_for(session.process.wait(), timeout=0.1)
+                except asyncio.TimeoutError:
                     session.process.kill()
+                    await session.process.wait()
             except Exception as e:
                 logger.error(f"Error terminating process for session {session_id}: {e}")
         
         del self.sessions[session_id]
+        user_sessions = self.user_sessions.get(session.user_id)
+        if user_sessions is not None:
+            user_sessions.pop(session_id, None)
+            if not user_sessions:
+                del self.user_sessions[session.user_id]
         logger.info(f"Session terminated: {session_id}")
         return True
-    
-    async def get_session_info(self, session_id: str) -> Optional[Dict]:
-        """세션 정보 조회"""
-        if session_id not in self.sessions:
-            return None
-        
-        session = self.sessions[session_id]
+
+    async def __aenter__(self) -> "BaseAgent":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # with 블록을 벗어나면 남은 세션을 모두 정리 (자식 프로세스 리크 방지)
+        for session_id in list(self.sessions):
+            await self.terminate_session(session_id)
+
+    def _session_info(self, session: Session) -> Dict:
+        """세션 객체로부터 직접 정보 dict 구성 (재조회 없이)"""
         return {
             "id": session.id,
             "user_id": session.user_id,
@@ -230,16 +297,23 @@ class BaseAgent(ABC):
             "working_directory": session.working_directory,
             "is_running": session.process is not None and session.process.returncode is None
         }
-    
+
+    async def get_session_info(self, session_id: str) -> Optional[Dict]:
+        """세션 정보 조회"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        return self._session_info(session)
+
     async def list_sessions(self, user_id: str = None) -> Dict:
         """세션 목록 조회"""
-        sessions = []
-        for session in self.sessions.values():
-            if user_id is None or session.user_id == user_id:
-                info = await self.get_session_info(session.id)
-                if info:
-                    sessions.append(info)
-        
+        if user_id is None:
+            source = self.sessions.values()
+        else:
+            # 전체 스캔 대신 해당 유저의 세션만 순회
+            source = self.user_sessions.get(user_id, {}).values()
+        sessions = [self._session_info(session) for session in source]
+
         return {
             "sessions": sessions,
             "total": len(sessions),
@@ -262,56 +336,74 @@ class ClaudeCodeAgent(BaseAgent):
     
     async def create_process(self, command: List[str], session: Session) -> subprocess.Popen:
         """프로세스 생성 (환경변수 설정 포함)"""
-        env = os.environ.copy()
-        # Claude 설정 디렉토리 지정
-        env['HOME'] = os.path.expanduser('~')
-        
+        # 명령마다 os.environ 전체를 복사하지 않도록 첫 호출 때 한 번만 구성
+        env = getattr(self, '_base_env', None)
+        if env is None:
+            env = os.environ.copy()
+            # Claude 설정 디렉토리 지정
+            env['HOME'] = os.path.expanduser('~')
+            self._base_env = env
+
         return await asyncio.create_subprocess_exec(
             *command,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
             cwd=session.working_directory,
-            env=env
+            env=env,
+            limit=STREAM_LIMIT
         )
     
     async def parse_output(self, output: str) -> Dict[str, Any]:
         """Claude Code 출력 파싱"""
+        # JSON이 아닌 줄은 try/except 비용 없이 바로 텍스트 처리
+        if not output or output[0] != '{':
+            return {
+                "type": "text",
+                "content": output,
+                "timestamp": iso_now()
+            }
         try:
-            # JSON 형식 파싱 시도
-            parsed = json.loads(output)
+            # JSON 형식 파싱 시도 (C 구현 파서 사용)
+            parsed = orjson.loads(output)
             # Claude Code의 실제 출력 내용 추출
             if "type" in parsed and parsed["type"] == "assistant":
                 content = ""
                 if "message" in parsed and "content" in parsed["message"]:
-                    for content_item in parsed["message"]["content"]:
-                        if content_item.get("type") == "text":
-                            content += content_item.get("text", "")
-                return {
+                    # += 누적은 청크 수에 대해 O(n^2) 복사라 join으로 한 번에 조립
+                    content = "".join(
+                        content_item.get("text", "")
+                        for content_item in parsed["message"]["content"]
+                        if content_item.get("type") == "text"
+                    )
+                result = {
                     "type": "assistant_response",
                     "content": content,
-                    "raw": parsed,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             elif "type" in parsed and parsed["type"] == "result":
-                return {
+                result = {
                     "type": "result",
                     "content": parsed.get("result", ""),
-                    "raw": parsed,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             else:
-                return {
+                result = {
                     "type": "raw_json",
                     "content": str(parsed),
-                    "raw": parsed,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
+
+            # 원본 JSON은 다운스트림에서 다시 직렬화되므로 기본적으로 빼고,
+            # 디버깅이 필요할 때만 설정으로 켠다
+            if self.config.include_raw:
+                result["raw"] = parsed
+            return result
         except json.JSONDecodeError:
             # 일반 텍스트로 처리
             return {
                 "type": "text",
                 "content": output,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             }
 
 class GeminiCLIAgent(BaseAgent):
@@ -329,12 +421,12 @@ class GeminiCLIAgent(BaseAgent):
         """Gemini CLI 출력 파싱"""
         try:
             # Gemini CLI의 출력 형식에 맞게 파싱
-            return json.loads(output)
+            return orjson.loads(output)
         except json.JSONDecodeError:
             return {
                 "type": "text",
                 "content": output,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             }
 
 class CustomAgent(BaseAgent):
@@ -344,15 +436,29 @@ class CustomAgent(BaseAgent):
         super().__init__(config)
         self.command_template = command_template
         self.parser_func = parser_func or self._default_parser
-    
-    async def prepare_command(self, message: str, session: Session) -> List[str]:
-        """커스텀 에이전트 명령어 준비"""
-        # 템플릿에서 {message} 치환
-        cmd_str = self.command_template.format(
+
+        # 등록 시점에 한 번만 토큰화 - 실행할 때마다 format/split을 반복하지 않음
+        # ({message} 자리는 남겨 두고 토큰 위치만 기록해 인자 순서를 보존)
+        tokens = shlex.split(command_template.format(
             executable=self.config.executable_path,
-            message=message
+            message='{message}'
+        ))
+        self._argv_template: tuple = tuple(tokens)
+        self._message_indices: tuple = tuple(
+            i for i, token in enumerate(tokens) if '{message}' in token
         )
-        return cmd_str.split()
+
+    async def prepare_command(self, message: str, session: Session) -> List[str]:
+        """커스텀 에이전트 명령어 준비"""
+        # 미리 토큰화한 argv에서 {message} 토큰만 제자리 치환
+        # (메시지는 공백이 있어도 단일 인자로 유지됨)
+        argv = list(self._argv_template)
+        if not self._message_indices:
+            argv.append(message)
+        else:
+            for i in self._message_indices:
+                argv[i] = argv[i].replace('{message}', message)
+        return argv
     
     async def parse_output(self, output: str) -> Dict[str, Any]:
         """커스텀 파서 사용"""
@@ -363,7 +469,7 @@ class CustomAgent(BaseAgent):
         return {
             "type": "text",
             "content": output,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": iso_now()
         }
 
 class AgentManager:
@@ -371,8 +477,19 @@ class AgentManager:
     
     def __init__(self):
         self.agents: Dict[AgentType, BaseAgent] = {}
-        self.session_to_agent: Dict[str, AgentType] = {}
-    
+        # 세션 -> 에이전트 객체 직접 매핑 (타입을 경유한 이중 해시 없이 라우팅)
+        self.session_to_agent: Dict[str, BaseAgent] = {}
+
+    @property
+    def n_agents(self) -> int:
+        """등록된 에이전트 수"""
+        return len(self.agents)
+
+    @property
+    def total_sessions(self) -> int:
+        """전체 활성 세션 수 (에이전트별 합산 없이 O(1) 조회)"""
+        return len(self.session_to_agent)
+
     def register_agent(self, agent_type: AgentType, agent: BaseAgent):
         """에이전트 등록"""
         self.agents[agent_type] = agent
@@ -384,67 +501,70 @@ class AgentManager:
     
     async def create_session(self, agent_type: AgentType, user_id: str, working_directory: str = None) -> Optional[str]:
         """지정된 에이전트로 세션 생성"""
-        if agent_type not in self.agents:
+        agent = self.agents.get(agent_type)
+        if agent is None:
             logger.error(f"Agent not found: {agent_type.value}")
             return None
-        
-        agent = self.agents[agent_type]
+
         session_id = await agent.create_session(user_id, working_directory)
         
         if session_id:
-            self.session_to_agent[session_id] = agent_type
-        
+            self.session_to_agent[session_id] = agent
+
         return session_id
     
     async def execute_command(self, session_id: str, message: str) -> AsyncGenerator[Dict[str, Any], None]:
         """세션에서 명령 실행"""
-        if session_id not in self.session_to_agent:
+        agent = self.session_to_agent.get(session_id)
+        if agent is None:
             yield {"error": "Session not found", "session_id": session_id}
             return
-        
-        agent_type = self.session_to_agent[session_id]
-        agent = self.agents[agent_type]
-        
+
         async for result in agent.execute_command(session_id, message):
             yield result
     
     async def terminate_session(self, session_id: str) -> bool:
         """세션 종료"""
-        if session_id not in self.session_to_agent:
+        agent = self.session_to_agent.get(session_id)
+        if agent is None:
             return False
-        
-        agent_type = self.session_to_agent[session_id]
-        agent = self.agents[agent_type]
-        
+
         success = await agent.terminate_session(session_id)
-        
-        if success and session_id in self.session_to_agent:
-            del self.session_to_agent[session_id]
-        
+
+        if success:
+            self.session_to_agent.pop(session_id, None)
+
         return success
     
+    async def terminate_all_sessions(self):
+        """모든 세션 종료 (서버 셧다운 시 자식 프로세스/PTY 정리용)"""
+        for session_id in list(self.session_to_agent.keys()):
+            try:
+                await self.terminate_session(session_id)
+            except Exception as e:
+                logger.error(f"Error terminating session {session_id} during shutdown: {e}")
+
     async def get_session_info(self, session_id: str) -> Optional[Dict]:
         """세션 정보 조회"""
-        if session_id not in self.session_to_agent:
+        agent = self.session_to_agent.get(session_id)
+        if agent is None:
             return None
-        
-        agent_type = self.session_to_agent[session_id]
-        agent = self.agents[agent_type]
-        
+
         return await agent.get_session_info(session_id)
     
     async def list_all_sessions(self, user_id: str = None) -> Dict:
-        """모든 에이전트의 세션 목록"""
+        """모든 에이전트의 세션 목록 (에이전트별 중간 dict 없이 한 번에 수집)"""
         all_sessions = []
-        total_sessions = 0
-        
-        for agent_type, agent in self.agents.items():
-            agent_sessions = await agent.list_sessions(user_id)
-            all_sessions.extend(agent_sessions["sessions"])
-            total_sessions += agent_sessions["total"]
-        
+
+        for agent in self.agents.values():
+            if user_id is None:
+                source = agent.sessions.values()
+            else:
+                source = agent.user_sessions.get(user_id, {}).values()
+            all_sessions.extend(agent._session_info(session) for session in source)
+
         return {
             "sessions": all_sessions,
-            "total": total_sessions,
+            "total": len(all_sessions),
             "available_agents": self.get_available_agents()
         }
\ No newline at end of file
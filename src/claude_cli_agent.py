@@ -4,19 +4,95 @@ Claude Code CLI 기반 에이전트
 """
 
 import asyncio
+import functools
+import shutil
 import subprocess
 import logging
 import json
+import orjson
+import re
 import uuid
 import os
 from typing import Dict, Any, AsyncGenerator, Optional, List
 from dataclasses import dataclass
 from datetime import datetime
 
-from agent_system import BaseAgent, AgentType, AgentConfig, Session
+from agent_system import (
+    BaseAgent, AgentType, AgentConfig, Session,
+    INITIAL_CWD, STREAM_LIMIT, STREAM_READ_CHUNK, iso_now
+)
 
 logger = logging.getLogger(__name__)
 
+# 세션 ID 추출용 패턴 (모듈 로드 시 한 번만 컴파일, 줄마다 재컴파일/조회 안 함)
+_UUID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE)
+# 디코드 전에 바이트 줄에서 바로 검사해 줄마다 .lower() 문자열 복사를 피함
+_SESSION_HINT = re.compile(rb'session[_:]', re.IGNORECASE)
+
+# --version 프로브를 돌릴 기본 후보 경로들
+_CLAUDE_CANDIDATES = [
+    '/usr/local/bin/claude',
+    '/usr/bin/claude',
+    os.path.expanduser('~/.npm-global/bin/claude')
+]
+
+def _discover_claude_cheap(executable_hint: Optional[str]) -> Optional[str]:
+    """fork/exec 없이 끝나는 탐색 경로 (설정 경로 stat + PATH 조회)"""
+    if executable_hint and os.path.isfile(executable_hint):
+        return executable_hint
+    return shutil.which('claude')
+
+@functools.lru_cache(maxsize=None)
+def _discover_claude(executable_hint: Optional[str]) -> Optional[str]:
+    """Claude 실행 파일 경로 탐색 (프로세스 수명 동안 결과 캐시)
+
+    에이전트를 다시 인스턴스화할 때마다 fork/exec 프로브를 반복하지 않도록
+    같은 힌트에 대해서는 한 번만 탐색한다.
+    """
+    found = _discover_claude_cheap(executable_hint)
+    if found:
+        return found
+
+    # 마지막 수단: 기본 경로들에 대해 --version 실행
+    for path in _CLAUDE_CANDIDATES:
+        try:
+            result = subprocess.run([path, '--version'],
+                                  capture_output=True, text=True, timeout=5)
+            if result.returncode == 0:
+                return path
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            continue
+
+    return None
+
+async def _adiscover_claude(executable_hint: Optional[str]) -> Optional[str]:
+    """_discover_claude의 비동기 버전
+
+    동기 버전의 subprocess.run 프로브는 콜드 미스 시 이벤트 루프를
+    후보당 최대 5초까지 막는다. 러닝 루프 안에서 에이전트를 만들 때는
+    이 코루틴으로 프로브해서 다른 태스크가 계속 돌게 한다.
+    """
+    found = _discover_claude_cheap(executable_hint)
+    if found:
+        return found
+
+    for path in _CLAUDE_CANDIDATES:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                path, '--version',
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            if await asyncio.wait_for(proc.wait(), 5) == 0:
+                return path
+        except FileNotFoundError:
+            continue
+        except asyncio.TimeoutError:
+            proc.kill()
+            continue
+
+    return None
+
 @dataclass
 class ClaudeCLISession:
     """Claude CLI 세션 정보"""
@@ -36,40 +112,54 @@ class ClaudeCodeCLIAgent(BaseAgent):
     - --resume으로 특정 세션 재개
     """
     
-    def __init__(self, config: AgentConfig):
+    def __init__(self, config: AgentConfig, claude_path: Optional[str] = None):
         super().__init__(config)
         self.cli_sessions: Dict[str, ClaudeCLISession] = {}
-        
-        # Claude 실행 파일 경로 확인
-        self.claude_path = self._find_claude_executable()
+
+        # Claude 실행 파일 경로 확인 (create() 팩토리가 미리 찾았으면 재탐색 안 함)
+        self.claude_path = claude_path or self._find_claude_executable()
         if not self.claude_path:
             raise FileNotFoundError("Claude Code CLI not found. Install with: npm install -g @anthropic-ai/claude-code")
-    
+
+        # 명령마다 os.environ.copy() + expanduser를 반복하지 않도록 한 번만 구성
+        self._base_env = self._build_base_env()
+
+        # 인스턴스 불변인 명령어 접두사도 미리 구성 (실행 시에는 복사 + append만)
+        self._base_cmd = [self.claude_path, '-p']  # print mode
+        if self.config.stream_format == 'json':
+            self._base_cmd += ['--output-format', 'json']
+
+    @staticmethod
+    def _build_base_env() -> Dict[str, str]:
+        """Claude 실행용 환경변수 구성 (Claude 인증 정보를 위해)"""
+        env = os.environ.copy()
+        env['HOME'] = os.path.expanduser('~')
+
+        # 잘못된 API 키 플레이스홀더 제거
+        if env.get('ANTHROPIC_API_KEY') in ['your_anthropic_api_key_here', 'your_key_here', '']:
+            del env['ANTHROPIC_API_KEY']
+            logger.info("Removed placeholder ANTHROPIC_API_KEY, will use browser auth")
+
+        # 추가 환경변수들
+        env.setdefault('XDG_CONFIG_HOME', os.path.join(env['HOME'], '.config'))
+        env.setdefault('XDG_CACHE_HOME', os.path.join(env['HOME'], '.cache'))
+        return env
+
+    @classmethod
+    async def create(cls, config: AgentConfig) -> "ClaudeCodeCLIAgent":
+        """이벤트 루프 안에서 사용하는 비동기 팩토리
+
+        생성자의 동기 --version 프로브 대신 비동기 프로브로 경로를 찾은 뒤
+        인스턴스를 만든다. 요청 핸들러 등 러닝 루프에서 등록할 때 사용.
+        """
+        claude_path = await _adiscover_claude(getattr(config, 'executable_path', None))
+        if not claude_path:
+            raise FileNotFoundError("Claude Code CLI not found. Install with: npm install -g @anthropic-ai/claude-code")
+        return cls(config, claude_path=claude_path)
+
     def _find_claude_executable(self) -> Optional[str]:
-        """Claude 실행 파일 경로 찾기"""
-        # 환경변수에서 지정된 경로 확인
-        if hasattr(self.config, 'executable_path') and self.config.executable_path:
-            if os.path.isfile(self.config.executable_path):
-                return self.config.executable_path
-        
-        # 기본 경로들 확인
-        possible_paths = [
-            'claude',
-            '/usr/local/bin/claude',
-            '/usr/bin/claude',
-            os.path.expanduser('~/.npm-global/bin/claude')
-        ]
-        
-        for path in possible_paths:
-            try:
-                result = subprocess.run([path, '--version'], 
-                                      capture_output=True, text=True, timeout=5)
-                if result.returncode == 0:
-                    return path
-            except (subprocess.TimeoutExpired, FileNotFoundError):
-                continue
-        
-        return None
+        """Claude 실행 파일 경로 찾기 (모듈 캐시 사용)"""
+        return _discover_claude(getattr(self.config, 'executable_path', None))
     
     async def create_session(self, user_id: str, working_directory: str = None) -> str:
         """새로운 CLI 세션 생성"""
@@ -78,7 +168,7 @@ class ClaudeCodeCLIAgent(BaseAgent):
         # CLI 세션 정보 저장
         self.cli_sessions[session_id] = ClaudeCLISession(
             session_id=session_id,
-            working_directory=working_directory or os.getcwd()
+            working_directory=working_directory or INITIAL_CWD
         )
         
         logger.info(f"Created Claude CLI session {session_id} in {working_directory}")
@@ -86,13 +176,12 @@ class ClaudeCodeCLIAgent(BaseAgent):
     
     async def execute_command(self, session_id: str, message: str) -> AsyncGenerator[Dict[str, Any], None]:
         """메시지를 Claude CLI로 실행"""
-        if session_id not in self.sessions or session_id not in self.cli_sessions:
+        cli_session = self.cli_sessions.get(session_id)
+        session = self.sessions.get(session_id)
+        if cli_session is None or session is None:
             yield {"error": "Session not found", "session_id": session_id}
             return
-        
-        cli_session = self.cli_sessions[session_id]
-        session = self.sessions[session_id]
-        
+
         try:
             # 명령어 구성
             cmd = await self._build_claude_command(cli_session, message)
@@ -103,7 +192,7 @@ class ClaudeCodeCLIAgent(BaseAgent):
                 "content": f"Claude CLI 실행 중... (명령: {' '.join(cmd[:3])}...)",
                 "session_id": session_id,
                 "agent_type": "claude_cli",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             }
             
             # Claude CLI 실행
@@ -123,20 +212,14 @@ class ClaudeCodeCLIAgent(BaseAgent):
                 "error_type": "cli_execution_error",
                 "session_id": session_id,
                 "agent_type": "claude_cli",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             }
     
     async def _build_claude_command(self, cli_session: ClaudeCLISession, message: str) -> List[str]:
         """Claude CLI 명령어 구성"""
-        cmd = [self.claude_path]
-        
-        # 기본 옵션
-        cmd.extend(['-p'])  # print mode
-        
-        # 출력 형식 (JSON이면 파싱하기 쉬움)
-        if self.config.stream_format == 'json':
-            cmd.extend(['--output-format', 'json'])
-        
+        # 불변 접두사 복사 후 세션별 옵션만 덧붙임
+        cmd = list(self._base_cmd)
+
         # 세션 연속성
         if cli_session.conversation_turns > 0:
             if cli_session.claude_session_id:
@@ -147,7 +230,7 @@ class ClaudeCodeCLIAgent(BaseAgent):
                 cmd.extend(['--continue'])
         
         # 작업 디렉토리 설정
-        if cli_session.working_directory != os.getcwd():
+        if cli_session.working_directory != INITIAL_CWD:
             cmd.extend(['--cwd', cli_session.working_directory])
         
         # 메시지 추가
@@ -158,30 +241,18 @@ class ClaudeCodeCLIAgent(BaseAgent):
     async def _execute_claude_cli(self, cmd: List[str], cli_session: ClaudeCLISession) -> AsyncGenerator[Dict[str, Any], None]:
         """Claude CLI 프로세스 실행 및 출력 스트리밍"""
         try:
-            # 환경변수 설정 (Claude 인증 정보를 위해)
-            env = os.environ.copy()
-            env['HOME'] = os.path.expanduser('~')
-            
-            # 잘못된 API 키 플레이스홀더 제거
-            if env.get('ANTHROPIC_API_KEY') in ['your_anthropic_api_key_here', 'your_key_here', '']:
-                del env['ANTHROPIC_API_KEY']
-                logger.info("Removed placeholder ANTHROPIC_API_KEY, will use browser auth")
-            
-            # 추가 환경변수들
-            if 'XDG_CONFIG_HOME' not in env:
-                env['XDG_CONFIG_HOME'] = os.path.join(env['HOME'], '.config')
-            if 'XDG_CACHE_HOME' not in env:
-                env['XDG_CACHE_HOME'] = os.path.join(env['HOME'], '.cache')
-            
+            # 미리 구성해 둔 환경변수 사용 (자식 프로세스 생성 시 커널이 복사)
+            env = self._base_env
             logger.info(f"Starting Claude CLI with HOME={env['HOME']}")
-            
+
             # 프로세스 시작
             process = await asyncio.create_subprocess_exec(
                 *cmd,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
                 cwd=cli_session.working_directory,
-                env=env
+                env=env,
+                limit=STREAM_LIMIT
             )
             
             logger.info(f"Started Claude CLI process: {' '.join(cmd)}")
@@ -201,7 +272,7 @@ class ClaudeCodeCLIAgent(BaseAgent):
                     "error_type": "api_key_error",
                     "return_code": return_code,
                     "help": "해결방법: claude auth set-key YOUR_ANTHROPIC_API_KEY",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             elif return_code != 0:
                 # 기타 에러
@@ -209,7 +280,7 @@ class ClaudeCodeCLIAgent(BaseAgent):
                     "error": f"Claude CLI가 에러로 종료되었습니다 (exit code: {return_code})",
                     "error_type": "cli_exit_error",
                     "return_code": return_code,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             else:
                 # 정상 완료
@@ -217,7 +288,7 @@ class ClaudeCodeCLIAgent(BaseAgent):
                     "type": "completion",
                     "content": f"Claude CLI 실행 완료 (exit code: {return_code})",
                     "return_code": return_code,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             
         except Exception as e:
@@ -225,103 +296,128 @@ class ClaudeCodeCLIAgent(BaseAgent):
             yield {
                 "error": f"CLI 프로세스 오류: {str(e)}",
                 "error_type": "process_error",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             }
     
     async def _stream_realtime(self, stdout, stderr, cli_session: ClaudeCLISession) -> AsyncGenerator[Dict[str, Any], None]:
-        """실시간으로 stdout과 stderr 스트리밍"""
-        
-        # 간단한 방법: stdout만 먼저 처리해보기
+        """stdout과 stderr를 동시에 읽어 먼저 도착한 순서대로 스트리밍
+
+        stdout을 EOF까지 읽은 뒤에야 stderr를 읽으면 stderr 파이프 버퍼가
+        가득 찼을 때 자식 프로세스가 교착될 수 있다. 두 스트림을 별도
+        태스크로 퍼 올려 하나의 큐에서 합류시킨다.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def _pump(stream, kind: str):
+            # 줄 단위 readline 대신 청크로 읽고 줄 분리는 로컬 버퍼에서 처리
+            buf = bytearray()
+            try:
+                while True:
+                    chunk = await stream.read(STREAM_READ_CHUNK)
+                    if not chunk:
+                        break
+                    buf += chunk
+                    while (nl := buf.find(b'\n')) >= 0:
+                        line = bytes(buf[:nl + 1])
+                        del buf[:nl + 1]
+                        await queue.put((kind, line))
+                if buf:
+                    # 개행 없이 끝난 꼬리 출력
+                    await queue.put((kind, bytes(buf)))
+            except Exception as e:
+                await queue.put(('pump_error', f"{kind} 읽기 오류: {str(e)}".encode('utf-8')))
+            finally:
+                await queue.put((kind, None))  # EOF 센티널
+
+        pump_tasks = [
+            asyncio.create_task(_pump(stdout, 'stdout')),
+            asyncio.create_task(_pump(stderr, 'stderr')),
+        ]
+
         try:
-            while True:
-                # stdout 읽기
-                stdout_line = await asyncio.wait_for(stdout.readline(), timeout=0.1)
-                if not stdout_line:
-                    break
-                    
-                text = stdout_line.decode('utf-8', errors='ignore').strip()
-                if text:
-                    # Claude 세션 ID 추출 시도
-                    if 'session_id' in text.lower() or 'session:' in text.lower():
+            remaining = len(pump_tasks)
+            while remaining:
+                kind, line = await queue.get()
+
+                if line is None:
+                    remaining -= 1
+                    continue
+
+                if kind == 'pump_error':
+                    yield {
+                        "type": "error",
+                        "content": f"스트림 읽기 오류: {line.decode('utf-8', errors='ignore')}",
+                        "timestamp": iso_now()
+                    }
+                    continue
+
+                text = line.decode('utf-8', errors='ignore').strip()
+                if not text:
+                    continue
+
+                if kind == 'stdout':
+                    # Claude 세션 ID 추출 시도 (힌트는 디코드 전 바이트에서 검사)
+                    if _SESSION_HINT.search(line):
                         session_id = self._extract_claude_session_id(text)
                         if session_id:
                             cli_session.claude_session_id = session_id
-                    
+
                     yield {
                         "type": "text",
                         "stream_type": "stdout",
                         "content": text,
-                        "timestamp": datetime.now().isoformat()
+                        "timestamp": iso_now()
                     }
-                
-        except asyncio.TimeoutError:
-            # 타임아웃은 정상적인 종료 조건
-            pass
-        except Exception as e:
-            yield {
-                "type": "error",
-                "content": f"스트림 읽기 오류: {str(e)}",
-                "timestamp": datetime.now().isoformat()
-            }
-        
-        # stderr도 확인
-        try:
-            while True:
-                stderr_line = await asyncio.wait_for(stderr.readline(), timeout=0.1)
-                if not stderr_line:
-                    break
-                    
-                text = stderr_line.decode('utf-8', errors='ignore').strip()
-                if text:
+                else:
                     yield {
                         "type": "error",
                         "stream_type": "stderr",
                         "content": text,
-                        "timestamp": datetime.now().isoformat()
+                        "timestamp": iso_now()
                     }
-                    
-        except asyncio.TimeoutError:
-            # 타임아웃은 정상적인 종료 조건
-            pass
-        except Exception as e:
-            yield {
-                "type": "error",
-                "content": f"stderr 읽기 오류: {str(e)}",
-                "timestamp": datetime.now().isoformat()
-            }
-    
-    
+        finally:
+            for task in pump_tasks:
+                if not task.done():
+                    task.cancel()
+
+
     def _extract_claude_session_id(self, text: str) -> Optional[str]:
         """텍스트에서 Claude 세션 ID 추출"""
-        import re
-        
-        # UUID 패턴 찾기
-        uuid_pattern = r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
-        matches = re.findall(uuid_pattern, text, re.IGNORECASE)
-        
-        if matches:
-            return matches[0]
-        
-        return None
+        # 첫 매치만 필요하므로 findall 대신 search
+        match = _UUID_RE.search(text)
+        return match.group(0) if match else None
     
     async def prepare_command(self, message: str, session: Session) -> List[str]:
         """호환성을 위한 메서드 (실제로는 사용하지 않음)"""
         return [message]
     
-    async def parse_output(self, output: str) -> Dict[str, Any]:
-        """출력 파싱 (JSON 형식 지원)"""
-        try:
-            # JSON 파싱 시도
-            if output.strip().startswith('{') and output.strip().endswith('}'):
-                return json.loads(output)
-        except json.JSONDecodeError:
-            pass
-        
+    async def parse_output(self, output) -> Dict[str, Any]:
+        """출력 파싱 (JSON 형식 지원, str 외에 raw bytes도 허용)
+
+        bytes로 받으면 디코드 없이 그대로 orjson에 넘기고,
+        텍스트 폴백일 때만 디코드한다 (JSON 줄은 str 할당 0회).
+        """
+        if isinstance(output, (bytes, bytearray)):
+            stripped = output.strip()
+            if stripped[:1] == b'{' and stripped[-1:] == b'}':
+                try:
+                    return orjson.loads(stripped)
+                except json.JSONDecodeError:
+                    pass
+            output = stripped.decode('utf-8', errors='ignore')
+        # JSON이 아닌 줄은 strip/try 비용 없이 바로 텍스트 처리
+        elif output and output[0] == '{' and output[-1] == '}':
+            try:
+                # C 구현 파서 사용 (orjson.JSONDecodeError는 json.JSONDecodeError의 서브클래스)
+                return orjson.loads(output)
+            except json.JSONDecodeError:
+                pass
+
         # 일반 텍스트
         return {
             "type": "text",
             "content": output,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": iso_now()
         }
     
     async def terminate_session(self, session_id: str) -> bool:
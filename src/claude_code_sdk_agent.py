@@ -1,7 +1,12 @@
 import asyncio
 import logging
 import json
+import orjson
+import hashlib
+import io
+import shelve
 import uuid
+from collections import OrderedDict
 from typing import Dict, Optional, AsyncGenerator, Any, List
 from dataclasses import dataclass
 from datetime import datetime
@@ -29,10 +34,145 @@ try:
 except ImportError:
     SDK_AVAILABLE = False
 
-from agent_system import BaseAgent, AgentType, AgentConfig, Session
+from agent_system import BaseAgent, AgentType, AgentConfig, Session, iso_now
 
 logger = logging.getLogger(__name__)
 
+# 세션당 보관할 최대 대화 기록 수 (초과 시 오래된 절반을 요약 자리로 치환)
+MAX_HISTORY = int(os.getenv('CLAUDE_MAX_HISTORY', 200))
+
+# 메모리에 유지할 최근 세션 수 (나머지는 디스크로 내림)
+MAX_CACHED_SESSIONS = int(os.getenv('CLAUDE_MAX_CACHED_SESSIONS', 32))
+
+# 동일 상태에서 동일 프롬프트 반복 시 SDK 호출을 건너뛰는 캐시 (옵트인)
+# LLM 추론이 전체 경로에서 압도적으로 비싸므로, 반복 프롬프트가 많은
+# 워크로드에서만 켠다 (응답 재생이 허용되는 경우에 한함)
+QUERY_CACHE_ENABLED = os.getenv('CLAUDE_QUERY_CACHE', '0') == '1'
+QUERY_CACHE_SIZE = int(os.getenv('CLAUDE_QUERY_CACHE_SIZE', 128))
+
+# SDK 기본 옵션 (환경변수 조회 + 변환은 모듈 로드 시 한 번만)
+_DEFAULT_MAX_TURNS = int(os.getenv('CLAUDE_MAX_TURNS', 10))
+_DEFAULT_SYSTEM_PROMPT = os.getenv('CLAUDE_SYSTEM_PROMPT', "You are a helpful coding assistant.")
+_DEFAULT_PERMISSION_MODE = os.getenv('CLAUDE_PERMISSION_MODE', 'acceptEdits')
+_DEFAULT_TOOLS = tuple(
+    tool.strip()
+    for tool in os.getenv('CLAUDE_ALLOWED_TOOLS', 'Read,Write,Edit,Bash,Glob,Grep').split(',')
+)
+_SESSION_PARALLELISM = int(os.getenv('CLAUDE_SESSION_PARALLELISM', 2))
+
+class ConversationStore:
+    """세션별 대화 기록 저장소 (shelve 디스크 저장 + 최근 세션 LRU 캐시)
+
+    모든 세션의 기록을 프로세스 힙에 상주시키면 RSS가 사용자 수 x 턴 수에
+    비례해 늘어난다. 최근에 사용한 세션 몇 개만 메모리에 두고 나머지는
+    shelve 파일로 내려 유휴 세션의 힙 점유를 0으로 만든다.
+    """
+
+    def __init__(self, path: str = None, max_cached: int = MAX_CACHED_SESSIONS):
+        if path is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'remote_agent')
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, 'conversations')
+        self._db = shelve.open(path)
+        self._lru: "OrderedDict[str, List]" = OrderedDict()
+        self._max_cached = max_cached
+
+    def get(self, session_id: str) -> Optional[List]:
+        """기록 조회 (read-through: 캐시 미스 시 디스크에서 올림)"""
+        messages = self._lru.get(session_id)
+        if messages is not None:
+            self._lru.move_to_end(session_id)
+            return messages
+
+        messages = self._db.get(session_id)
+        if messages is not None:
+            self._cache(session_id, messages)
+        return messages
+
+    def set(self, session_id: str, messages: List):
+        """기록 저장 (캐시 + 디스크 동시 갱신)"""
+        self._cache(session_id, messages)
+        try:
+            self._db[session_id] = messages
+        except Exception as e:
+            # pickle 불가능한 메시지 객체면 메모리 캐시로만 유지
+            logger.debug("Could not persist history for %s: %s", session_id, e)
+
+    def pop(self, session_id: str):
+        """세션 종료 시 기록 제거"""
+        self._lru.pop(session_id, None)
+        try:
+            del self._db[session_id]
+        except KeyError:
+            pass
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._lru or session_id in self._db
+
+    def _cache(self, session_id: str, messages: List):
+        self._lru[session_id] = messages
+        self._lru.move_to_end(session_id)
+        while len(self._lru) > self._max_cached:
+            evicted_id, evicted = self._lru.popitem(last=False)
+            try:
+                self._db[evicted_id] = evicted
+            except Exception:
+                pass
+
+# _safe_serialize 폴백용 타입 -> 처리기 테이블
+# (노드마다 isinstance 사다리를 타지 않고 type()으로 O(1) 조회)
+def _ser_scalar(parent, key, current, stack):
+    parent[key] = current
+
+def _ser_dict(parent, key, current, stack):
+    converted: Dict[str, Any] = {}
+    parent[key] = converted
+    for k, v in current.items():
+        stack.append((converted, k, v))
+
+def _ser_seq(parent, key, current, stack):
+    slots = [None] * len(current)
+    parent[key] = slots
+    for i, v in enumerate(current):
+        stack.append((slots, i, v))
+
+_SERIALIZE_DISPATCH = {
+    type(None): _ser_scalar,
+    str: _ser_scalar,
+    int: _ser_scalar,
+    float: _ser_scalar,
+    bool: _ser_scalar,
+    dict: _ser_dict,
+    list: _ser_seq,
+    tuple: _ser_seq,
+}
+
+def _safe_serialize(obj) -> Any:
+    """객체를 JSON 직렬화 가능한 형태로 변환 (모듈 레벨 공용 함수)"""
+    # 빠른 경로: orjson은 dataclass(SDK 블록 타입들 포함)를 C 레벨에서
+    # 바로 dict로 직렬화하므로 파이썬 순회 없이 한 번에 끝난다
+    try:
+        return orjson.loads(orjson.dumps(obj, default=str))
+    except (TypeError, orjson.JSONEncodeError):
+        pass
+
+    # 폴백: 재귀 대신 명시적 스택 순회 (깊은 트리의 호출 프레임 비용 제거)
+    root: Dict[str, Any] = {"value": None}
+    stack = [(root, "value", obj)]
+    dispatch = _SERIALIZE_DISPATCH
+
+    while stack:
+        parent, key, current = stack.pop()
+        handler = dispatch.get(type(current))
+        if handler is not None:
+            handler(parent, key, current, stack)
+        elif hasattr(current, '__dict__'):
+            stack.append((parent, key, vars(current)))
+        else:
+            parent[key] = str(current)
+
+    return root["value"]
+
 class ClaudeCodeSDKAgent(BaseAgent):
     """공식 Claude Code SDK를 사용하는 에이전트 클래스
     
@@ -51,28 +191,57 @@ class ClaudeCodeSDKAgent(BaseAgent):
             raise ImportError("claude-code-sdk is not installed. Install with: pip install claude-code-sdk")
         
         super().__init__(config)
-        # 대화 기록을 저장하는 딕셔너리 (세션 ID -> 메시지 리스트)
-        self.conversation_history: Dict[str, List] = {}
+        # 대화 기록 저장소 (최근 세션만 메모리, 나머지는 디스크)
+        self.conversation_history = ConversationStore()
+        # 세션별 SDK 옵션 캐시 (cwd만 다르므로 명령마다 재구성하지 않음)
+        self._session_options: Dict[str, "ClaudeCodeOptions"] = {}
+        # 프롬프트 해시 -> 수신 메시지 리스트 (QUERY_CACHE_ENABLED일 때만 사용)
+        self._query_cache: "OrderedDict[str, List]" = OrderedDict()
+        # 세션별 동시 턴 상한 (연속 프롬프트가 무한정 적체되지 않도록 제한)
+        self._session_sem: Dict[str, asyncio.Semaphore] = {}
+        # 세션별로 미리 채워 둔 응답 템플릿 (yield마다 같은 키를 재구성하지 않음)
+        self._templates: Dict[str, Dict[str, Dict[str, Any]]] = {}
         
-        # SDK 옵션 설정
+        # SDK 옵션 설정 (모듈 로드 시 캐시된 기본값 사용)
         self.sdk_options = ClaudeCodeOptions(
-            max_turns=int(os.getenv('CLAUDE_MAX_TURNS', 10)),
-            system_prompt=os.getenv('CLAUDE_SYSTEM_PROMPT', "You are a helpful coding assistant."),
-            permission_mode=os.getenv('CLAUDE_PERMISSION_MODE', 'acceptEdits'),
+            max_turns=_DEFAULT_MAX_TURNS,
+            system_prompt=_DEFAULT_SYSTEM_PROMPT,
+            permission_mode=_DEFAULT_PERMISSION_MODE,
             allowed_tools=self._get_allowed_tools()
         )
+
+        # 메시지 타입 -> 핸들러 디스패치 테이블
+        # (메시지마다 isinstance 체인을 순회하지 않고 타입으로 O(1) 조회)
+        self._msg_handlers = {
+            AssistantMessage: self._parse_assistant_message,
+            UserMessage: self._parse_user_message,
+            SystemMessage: self._parse_system_message,
+            ResultMessage: self._parse_result_message,
+        }
     
+    def _query_cache_key(self, session: Session, session_id: str, message: str) -> str:
+        """세션 상태 + 프롬프트로 캐시 키 생성
+
+        같은 작업 디렉토리/옵션/대화 길이에서 같은 프롬프트가 다시 오면
+        같은 키가 나온다 (대화가 진행되면 길이가 달라져 키도 달라짐).
+        """
+        history = self.conversation_history.get(session_id)
+        state = [
+            session.working_directory,
+            self.sdk_options.system_prompt,
+            self.sdk_options.allowed_tools,
+            len(history) if history else 0,
+            message,
+        ]
+        return hashlib.sha256(orjson.dumps(state)).hexdigest()
+
     def _get_allowed_tools(self) -> List[str]:
         """환경변수에서 허용된 도구 목록을 가져와 반환
         
         Returns:
             List[str]: 허용된 도구 이름 리스트
         """
-        tools_env = os.getenv('CLAUDE_ALLOWED_TOOLS', '')
-        if tools_env:
-            return [tool.strip() for tool in tools_env.split(',')]
-        # 기본 허용 도구들
-        return ["Read", "Write", "Edit", "Bash", "Glob", "Grep"]
+        return list(_DEFAULT_TOOLS)
     
     async def prepare_command(self, message: str, session: Session) -> List[str]:
         """메시지를 명령어 형태로 변환 (호환성을 위해 유지)
@@ -102,8 +271,26 @@ class ClaudeCodeSDKAgent(BaseAgent):
         session_id = await super().create_session(user_id, working_directory)
         
         # 대화 기록 초기화
-        self.conversation_history[session_id] = []
-        
+        self.conversation_history.set(session_id, [])
+
+        # 세션 생성 시점에 옵션을 한 번만 구성 (작업 디렉토리만 세션별로 다름)
+        session = self.sessions[session_id]
+        self._session_options[session_id] = ClaudeCodeOptions(
+            max_turns=self.sdk_options.max_turns,
+            system_prompt=self.sdk_options.system_prompt,
+            cwd=session.working_directory,
+            permission_mode=self.sdk_options.permission_mode,
+            allowed_tools=self.sdk_options.allowed_tools
+        )
+        self._session_sem[session_id] = asyncio.Semaphore(_SESSION_PARALLELISM)
+        # 스트리밍 yield에서 {**템플릿, ...}으로 얕은 복사만 하도록 공통 키를 고정
+        base = {"session_id": session_id, "agent_type": "claude_code"}
+        self._templates[session_id] = {
+            "status": {"type": "status", "content": "Claude Code SDK 실행 중...", **base},
+            "completion": {"type": "completion", **base},
+            "error": base,
+        }
+
         logger.info(f"Claude SDK session created: {session_id} in {working_directory}")
         return session_id
     
@@ -124,119 +311,143 @@ class ClaudeCodeSDKAgent(BaseAgent):
         session = self.sessions[session_id]
         
         try:
-            # SDK 옵션에 작업 디렉토리 설정
-            options = ClaudeCodeOptions(
-                max_turns=self.sdk_options.max_turns,
-                system_prompt=self.sdk_options.system_prompt,
-                cwd=session.working_directory,
-                permission_mode=self.sdk_options.permission_mode,
-                allowed_tools=self.sdk_options.allowed_tools
-            )
-            
+            # 세션 생성 시 캐시해 둔 SDK 옵션 사용
+            options = self._session_options[session_id]
+
             logger.info(f"Executing Claude SDK query in session {session_id}: {message[:100]}...")
-            
+
+            tmpl = self._templates[session_id]
+
             # 시작 메시지 전송
-            yield {
-                "type": "status",
-                "content": "Claude Code SDK 실행 중...",
-                "session_id": session_id,
-                "agent_type": "claude_code",
-                "timestamp": datetime.now().isoformat()
-            }
+            yield {**tmpl["status"], "timestamp": iso_now()}
             
-            # SDK를 통한 쿼리 실행
+            # 반복 프롬프트 캐시 조회 (세션 상태 + 프롬프트 해시 기준)
+            cache_key = None
+            if QUERY_CACHE_ENABLED:
+                cache_key = self._query_cache_key(session, session_id, message)
+                cached_messages = self._query_cache.get(cache_key)
+                if cached_messages is not None:
+                    self._query_cache.move_to_end(cache_key)
+                    logger.info(f"Query cache hit for session {session_id}")
+                    for sdk_message in cached_messages:
+                        parsed_output = await self.parse_sdk_message(sdk_message)
+                        parsed_output["session_id"] = session_id
+                        parsed_output["agent_type"] = "claude_code"
+                        parsed_output["cached"] = True
+                        yield parsed_output
+                    yield {
+                        **tmpl["completion"],
+                        "content": f"Claude Code SDK 실행 완료 (캐시). {len(cached_messages)}개 메시지 수신",
+                        "timestamp": iso_now(),
+                        "message_count": len(cached_messages),
+                        "cached": True
+                    }
+                    return
+
+            # SDK를 통한 쿼리 실행 (세션당 동시 턴 수를 세마포어로 제한)
             messages_received = []
-            
+
             try:
-                async for sdk_message in query(prompt=message, options=options):
-                    messages_received.append(sdk_message)
+                async with self._session_sem[session_id]:
+                    async for sdk_message in query(prompt=message, options=options):
+                        messages_received.append(sdk_message)
                     
-                    # 메시지 파싱 및 전송
-                    parsed_output = await self.parse_sdk_message(sdk_message)
-                    parsed_output["session_id"] = session_id
-                    parsed_output["agent_type"] = "claude_code"
+                        # 메시지 파싱 및 전송
+                        parsed_output = await self.parse_sdk_message(sdk_message)
+                        parsed_output["session_id"] = session_id
+                        parsed_output["agent_type"] = "claude_code"
                     
-                    yield parsed_output
+                        yield parsed_output
                 
-                # 대화 기록에 저장
-                self.conversation_history[session_id].extend(messages_received)
-                
-                # 완료 메시지
-                yield {
-                    "type": "completion",
-                    "content": f"Claude Code SDK 실행 완료. {len(messages_received)}개 메시지 수신",
-                    "session_id": session_id,
-                    "agent_type": "claude_code",
-                    "timestamp": datetime.now().isoformat(),
-                    "message_count": len(messages_received)
-                }
+                    # 대화 기록에 저장
+                    history = self.conversation_history.get(session_id) or []
+                    history.extend(messages_received)
+
+                    # 긴 세션에서 RSS가 턴 수에 비례해 늘지 않도록 기록 상한 적용:
+                    # 최근 절반만 남기고 나머지는 요약 플레이스홀더 하나로 치환
+                    if len(history) > MAX_HISTORY:
+                        keep = MAX_HISTORY // 2
+                        truncated = len(history) - keep
+                        history = [
+                            {"type": "summary", "content": f"<{truncated} prior messages truncated>"}
+                        ] + history[-keep:]
+                    self.conversation_history.set(session_id, history)
+
+                    # 성공한 턴을 캐시에 적재 (LRU 상한 적용)
+                    if cache_key is not None:
+                        self._query_cache[cache_key] = messages_received
+                        self._query_cache.move_to_end(cache_key)
+                        while len(self._query_cache) > QUERY_CACHE_SIZE:
+                            self._query_cache.popitem(last=False)
+
+                    # 완료 메시지
+                    yield {
+                        **tmpl["completion"],
+                        "content": f"Claude Code SDK 실행 완료. {len(messages_received)}개 메시지 수신",
+                        "timestamp": iso_now(),
+                        "message_count": len(messages_received)
+                    }
             
             # SDK 특정 에러 타입들을 개별적으로 처리
             except CLINotFoundError:
                 error_msg = "Claude Code CLI가 설치되지 않았습니다. 'npm install -g @anthropic-ai/claude-code'로 설치해주세요."
                 logger.error(f"CLI not found in session {session_id}")
                 yield {
+                    **tmpl["error"],
                     "error": error_msg,
                     "error_type": "cli_not_found",
-                    "session_id": session_id,
-                    "agent_type": "claude_code",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             
             except CLIConnectionError as e:
                 error_msg = f"Claude Code CLI 연결 오류: {str(e)}"
                 logger.error(f"CLI connection error in session {session_id}: {e}")
                 yield {
+                    **tmpl["error"],
                     "error": error_msg,
                     "error_type": "cli_connection_error",
-                    "session_id": session_id,
-                    "agent_type": "claude_code",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             
             except ProcessError as e:
                 error_msg = f"Claude Code 프로세스 오류 (exit code: {e.exit_code}): {str(e)}"
                 logger.error(f"Process error in session {session_id}: {e}")
                 yield {
+                    **tmpl["error"],
                     "error": error_msg,
                     "error_type": "process_error",
                     "exit_code": e.exit_code,
-                    "session_id": session_id,
-                    "agent_type": "claude_code",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             
             except CLIJSONDecodeError as e:
                 error_msg = f"Claude Code 응답 파싱 오류: {str(e)}"
                 logger.error(f"JSON decode error in session {session_id}: {e}")
                 yield {
+                    **tmpl["error"],
                     "error": error_msg,
                     "error_type": "json_decode_error",
-                    "session_id": session_id,
-                    "agent_type": "claude_code",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             
             except ClaudeSDKError as e:
                 error_msg = f"Claude SDK 일반 오류: {str(e)}"
                 logger.error(f"Claude SDK error in session {session_id}: {e}")
                 yield {
+                    **tmpl["error"],
                     "error": error_msg,
                     "error_type": "claude_sdk_error",
-                    "session_id": session_id,
-                    "agent_type": "claude_code",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
             
             except Exception as sdk_error:
                 error_msg = f"예상치 못한 오류: {str(sdk_error)}"
                 logger.error(f"Unexpected error in session {session_id}: {sdk_error}", exc_info=True)
                 yield {
+                    **tmpl["error"],
                     "error": error_msg,
                     "error_type": "unexpected_error",
-                    "session_id": session_id,
-                    "agent_type": "claude_code",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": iso_now()
                 }
         
         except Exception as e:
@@ -246,24 +457,9 @@ class ClaudeCodeSDKAgent(BaseAgent):
                 "error_type": "agent_error",
                 "session_id": session_id,
                 "agent_type": "claude_code",
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             }
     
-    def _safe_serialize(self, obj) -> Any:
-        """객체를 JSON 직렬화 가능한 형태로 변환"""
-        if obj is None:
-            return None
-        elif isinstance(obj, (str, int, float, bool)):
-            return obj
-        elif isinstance(obj, dict):
-            return {k: self._safe_serialize(v) for k, v in obj.items()}
-        elif isinstance(obj, (list, tuple)):
-            return [self._safe_serialize(item) for item in obj]
-        elif hasattr(obj, '__dict__'):
-            return self._safe_serialize(obj.__dict__)
-        else:
-            return str(obj)
-    
     def _extract_content_from_blocks(self, content_blocks) -> Dict[str, Any]:
         """공식 SDK의 콘텐츠 블록들에서 데이터를 추출
         
@@ -274,21 +470,33 @@ class ClaudeCodeSDKAgent(BaseAgent):
             Dict[str, Any]: 추출된 콘텐츠 정보
         """
         extracted_data = {
+            "content": "",
             "text_content": [],
             "tool_uses": [],
             "tool_results": [],
             "raw_blocks": []
         }
-        
+
         if not content_blocks:
             return extracted_data
-            
+
+        # 원본 블록 직렬화는 스트리밍 루프에서 가장 비싼 할당 경로라
+        # include_raw가 켜진 에이전트에서만 수행
+        include_raw = self.config.include_raw
+
+        # 블록을 순회하며 텍스트를 바로 버퍼에 누적 (사후 join 생략)
+        text_buf = io.StringIO()
+
         for block in content_blocks:
-            # 원본 블록 정보 저장
-            extracted_data["raw_blocks"].append(self._safe_serialize(block))
-            
+            # 원본 블록 정보 저장 (옵트인)
+            if include_raw:
+                extracted_data["raw_blocks"].append(_safe_serialize(block))
+
             # TextBlock 처리
             if isinstance(block, TextBlock):
+                if extracted_data["text_content"]:
+                    text_buf.write("\n")
+                text_buf.write(block.text)
                 extracted_data["text_content"].append(block.text)
             
             # ToolUseBlock 처리
@@ -311,88 +519,94 @@ class ClaudeCodeSDKAgent(BaseAgent):
             
             # 기타 블록 타입에 대해서는 문자열로 변환
             else:
-                extracted_data["text_content"].append(str(block))
-        
+                text = str(block)
+                if extracted_data["text_content"]:
+                    text_buf.write("\n")
+                text_buf.write(text)
+                extracted_data["text_content"].append(text)
+
+        extracted_data["content"] = text_buf.getvalue()
         return extracted_data
 
+    def _parse_assistant_message(self, message) -> Dict[str, Any]:
+        """AssistantMessage 처리"""
+        extracted_data = self._extract_content_from_blocks(message.content)
+
+        return {
+            "type": "assistant_message",
+            "content": extracted_data["content"],
+            "text_blocks": extracted_data["text_content"],
+            "tool_uses": extracted_data["tool_uses"],
+            "tool_results": extracted_data["tool_results"],
+            "block_count": len(message.content) if message.content else 0,
+            "raw_blocks": extracted_data["raw_blocks"],
+            "timestamp": iso_now()
+        }
+
+    def _parse_user_message(self, message) -> Dict[str, Any]:
+        """UserMessage 처리"""
+        content = ""
+        if hasattr(message, 'content'):
+            if isinstance(message.content, str):
+                content = message.content
+            else:
+                content = str(message.content)
+
+        return {
+            "type": "user_message",
+            "content": content,
+            "timestamp": iso_now()
+        }
+
+    def _parse_system_message(self, message) -> Dict[str, Any]:
+        """SystemMessage 처리"""
+        content = getattr(message, 'content', str(message))
+        return {
+            "type": "system_message",
+            "content": str(content),
+            "timestamp": iso_now()
+        }
+
+    def _parse_result_message(self, message) -> Dict[str, Any]:
+        """ResultMessage 처리"""
+        return {
+            "type": "result_message",
+            "content": str(message),
+            "raw_data": _safe_serialize(message),
+            "timestamp": iso_now()
+        }
+
+    def _parse_unknown_message(self, message) -> Dict[str, Any]:
+        """알려지지 않은 메시지 타입 처리"""
+        message_type = type(message).__name__
+        logger.warning(f"Unknown message type: {message_type}")
+        return {
+            "type": f"unknown_{message_type.lower()}",
+            "content": str(message),
+            "raw_data": _safe_serialize(message),
+            "timestamp": iso_now()
+        }
+
     async def parse_sdk_message(self, message) -> Dict[str, Any]:
         """공식 Claude SDK 메시지를 파싱하여 구조화된 데이터로 변환
-        
+
         Args:
             message: Claude SDK에서 수신한 메시지 객체
-            
+
         Returns:
             Dict[str, Any]: 파싱된 메시지 데이터
         """
         try:
-            # 메시지 타입 확인
-            message_type = type(message).__name__
-            
-            # AssistantMessage 처리
-            if isinstance(message, AssistantMessage):
-                extracted_data = self._extract_content_from_blocks(message.content)
-                
-                return {
-                    "type": "assistant_message",
-                    "content": "\n".join(extracted_data["text_content"]) if extracted_data["text_content"] else "",
-                    "text_blocks": extracted_data["text_content"],
-                    "tool_uses": extracted_data["tool_uses"],
-                    "tool_results": extracted_data["tool_results"],
-                    "block_count": len(extracted_data["raw_blocks"]),
-                    "raw_blocks": extracted_data["raw_blocks"],
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            # UserMessage 처리
-            elif isinstance(message, UserMessage):
-                content = ""
-                if hasattr(message, 'content'):
-                    if isinstance(message.content, str):
-                        content = message.content
-                    else:
-                        content = str(message.content)
-                
-                return {
-                    "type": "user_message",
-                    "content": content,
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            # SystemMessage 처리
-            elif isinstance(message, SystemMessage):
-                content = getattr(message, 'content', str(message))
-                return {
-                    "type": "system_message",
-                    "content": str(content),
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            # ResultMessage 처리
-            elif isinstance(message, ResultMessage):
-                return {
-                    "type": "result_message",
-                    "content": str(message),
-                    "raw_data": self._safe_serialize(message),
-                    "timestamp": datetime.now().isoformat()
-                }
-            
-            # 알려지지 않은 메시지 타입 처리
-            else:
-                logger.warning(f"Unknown message type: {message_type}")
-                return {
-                    "type": f"unknown_{message_type.lower()}",
-                    "content": str(message),
-                    "raw_data": self._safe_serialize(message),
-                    "timestamp": datetime.now().isoformat()
-                }
-                
+            handler = self._msg_handlers.get(type(message), self._parse_unknown_message)
+            return handler(message)
+
         except Exception as e:
             logger.error(f"Error parsing SDK message: {e}", exc_info=True)
             return {
                 "type": "parse_error",
                 "content": str(message),
                 "error": str(e),
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             }
     
     async def parse_output(self, output: str) -> Dict[str, Any]:
@@ -400,7 +614,7 @@ class ClaudeCodeSDKAgent(BaseAgent):
         return {
             "type": "text",
             "content": output,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": iso_now()
         }
     
     async def terminate_session(self, session_id: str) -> bool:
@@ -412,11 +626,16 @@ class ClaudeCodeSDKAgent(BaseAgent):
         Returns:
             bool: 종료 성공 여부
         """
+        # 세션 옵션 캐시 정리
+        self._session_options.pop(session_id, None)
+        self._session_sem.pop(session_id, None)
+        self._templates.pop(session_id, None)
+
         # 대화 기록 정리
-        if session_id in self.conversation_history:
-            conversation_length = len(self.conversation_history[session_id])
-            del self.conversation_history[session_id]
-            logger.info(f"Cleaned up conversation history for session {session_id} ({conversation_length} messages)")
+        history = self.conversation_history.get(session_id)
+        if history is not None:
+            self.conversation_history.pop(session_id)
+            logger.info(f"Cleaned up conversation history for session {session_id} ({len(history)} messages)")
         
         return await super().terminate_session(session_id)
     
@@ -441,8 +660,9 @@ class ClaudeCodeSDKAgent(BaseAgent):
             Optional[Dict]: 세션 정보 또는 None
         """
         info = await super().get_session_info(session_id)
-        if info and session_id in self.conversation_history:
-            info["conversation_length"] = len(self.conversation_history[session_id])
+        history = self.conversation_history.get(session_id) if info else None
+        if info and history is not None:
+            info["conversation_length"] = len(history)
             info["sdk_options"] = {
                 "max_turns": self.sdk_options.max_turns,
                 "permission_mode": self.sdk_options.permission_mode,
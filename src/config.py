@@ -1,25 +1,55 @@
-import json
+import functools
 import logging
 import os
+import orjson
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
 from typing import Dict, Any, Optional
 
+@functools.lru_cache(maxsize=8)
+def _load_cached(path: str, mtime_ns: int) -> Dict[str, Any]:
+    """(경로, mtime_ns) 기준으로 파싱 결과를 캐시
+
+    같은 mtime이면 디스크 I/O와 파싱을 모두 건너뛰고,
+    파일이 바뀌면 키가 달라져 자연스럽게 다시 읽는다.
+    """
+    return orjson.loads(Path(path).read_bytes())
+
 class Config:
     """설정 파일 관리 클래스"""
     
     def __init__(self, config_path: str = "config.json"):
         self.config_path = config_path
         self.config = self._load_config()
+        self._flat = self._flatten(self.config)
         self._setup_logging()
+
+    @staticmethod
+    def _flatten(tree: Dict[str, Any]) -> Dict[str, Any]:
+        """중첩 dict를 점 표기 키로 평탄화 (중간 노드도 포함)
+
+        get()이 호출마다 split + 트리 탐색을 하지 않도록 로드 시 한 번만 계산.
+        """
+        flat: Dict[str, Any] = {}
+        stack = [("", tree)]
+        while stack:
+            prefix, node = stack.pop()
+            for k, v in node.items():
+                dotted = f"{prefix}{k}"
+                flat[dotted] = v
+                if isinstance(v, dict):
+                    stack.append((f"{dotted}.", v))
+        return flat
     
     def _load_config(self) -> Dict[str, Any]:
         """설정 파일 로드"""
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return _load_cached(self.config_path, os.stat(self.config_path).st_mtime_ns)
         except FileNotFoundError:
             print(f"Warning: Config file {self.config_path} not found. Using defaults.")
             return self._get_default_config()
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"Error: Invalid JSON in config file: {e}")
             return self._get_default_config()
     
@@ -65,13 +95,14 @@ class Config:
         # 로깅 포맷 설정
         format_str = logging_config.get("format", "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
         
-        # 로깅 설정 적용
+        # 로깅 설정 적용 (datefmt 지정으로 밀리초 포맷 연산 생략)
         logging.basicConfig(
             level=level,
             format=format_str,
+            datefmt=logging_config.get("datefmt", "%H:%M:%S"),
             force=True  # 기존 설정 덮어쓰기
         )
-        
+
         # 파일 로깅 설정 (선택사항)
         log_file = logging_config.get("file")
         if log_file:
@@ -79,19 +110,20 @@ class Config:
             file_handler.setLevel(level)
             file_handler.setFormatter(logging.Formatter(format_str))
             logging.getLogger().addHandler(file_handler)
+
+        # 실제 출력(포맷/flush)은 리스너 스레드로 넘겨 이벤트 루프를 막지 않음
+        root = logging.getLogger()
+        handlers = root.handlers[:]
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        for handler in handlers:
+            root.removeHandler(handler)
+        root.addHandler(QueueHandler(log_queue))
+        self._log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self._log_listener.start()
     
     def get(self, key: str, default: Any = None) -> Any:
         """설정 값 가져오기 (점 표기법 지원)"""
-        keys = key.split('.')
-        value = self.config
-        
-        for k in keys:
-            if isinstance(value, dict) and k in value:
-                value = value[k]
-            else:
-                return default
-        
-        return value
+        return self._flat.get(key, default)
     
     def get_logging_level(self) -> str:
         """로깅 레벨 반환"""
@@ -1,69 +1,138 @@
 import asyncio
-import json
+import orjson
 import logging
+import os
 from typing import Dict, Any, AsyncGenerator, Optional
-from agent_system import BaseAgent, Session
+from agent_system import BaseAgent, Session, STREAM_READ_CHUNK
 
 logger = logging.getLogger(__name__)
 
 class PersistentClaudeAgent(BaseAgent):
     """지속적인 Claude Code 에이전트 (Interactive 모드)"""
     
-    def __init__(self, config):
+    def __init__(self, config, warm_pool_size: int = None):
         super().__init__(config)
         self.claude_processes: Dict[str, asyncio.subprocess.Process] = {}
         self.executing_sessions: set = set()  # 실행 중인 세션 추적
-    
+
+        # stdin 쓰기는 세션별 큐 + 전담 태스크 하나로 모아서 처리
+        # (write + drain 경합을 호출자 태스크에서 떼어냄)
+        self._stdin_queues: Dict[str, asyncio.Queue] = {}
+        self._stdin_tasks: Dict[str, asyncio.Task] = {}
+
+        # 웜 풀: 기본 작업 디렉토리용 Claude 프로세스를 미리 띄워 두고
+        # 세션 생성 시 스폰 + 초기화 지연 없이 꺼내 씀
+        if warm_pool_size is None:
+            warm_pool_size = int(os.getenv('PERSISTENT_WARM_POOL', 0))
+        self.warm_pool_size = warm_pool_size
+        self._warm_pool: asyncio.Queue = asyncio.Queue()
+
+    async def _spawn_process(self, working_directory: str = None) -> asyncio.subprocess.Process:
+        """Claude interactive 프로세스 스폰"""
+        return await asyncio.create_subprocess_exec(
+            self.config.executable_path,
+            '--print',
+            '--output-format=stream-json',
+            '--verbose',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=working_directory or ".",
+            env=self._get_environment()
+        )
+
+    async def prewarm(self, count: int = None):
+        """웜 풀 채우기 (스폰 + 초기화까지 미리 끝냄)"""
+        count = self.warm_pool_size if count is None else count
+        for _ in range(count):
+            try:
+                process = await self._spawn_process(self.config.working_directory)
+                if await self._read_initial_output(process):
+                    await self._warm_pool.put(process)
+                else:
+                    process.terminate()
+            except Exception as e:
+                logger.warning(f"Failed to prewarm Claude process: {e}")
+        logger.info(f"Persistent Claude warm pool ready: {self._warm_pool.qsize()} process(es)")
+
+    async def _refill_warm_pool(self):
+        """풀에서 하나를 꺼내 쓴 뒤 백그라운드에서 다시 채움"""
+        try:
+            await self.prewarm(1)
+        except Exception as e:
+            logger.warning(f"Failed to refill Claude warm pool: {e}")
+
     async def create_session(self, user_id: str, working_directory: str = None) -> str:
         """세션 생성 및 Claude interactive 프로세스 시작"""
         session_id = await super().create_session(user_id, working_directory)
-        
-        # Claude interactive 프로세스 시작
+
         try:
-            process = await asyncio.create_subprocess_exec(
-                self.config.executable_path,
-                '--print',
-                '--output-format=stream-json',
-                '--verbose',
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=working_directory or ".",
-                env=self._get_environment()
-            )
-            
-            self.claude_processes[session_id] = process
-            logger.info(f"Started persistent Claude process for session {session_id}")
-            
-            # 초기화 메시지 읽기 및 검증
-            init_success = await self._read_initial_output(process)
-            if not init_success:
-                # stderr에서 에러 메시지 확인
+            # 기본 작업 디렉토리면 웜 풀에서 초기화 완료된 프로세스를 재사용
+            process = None
+            if working_directory in (None, self.config.working_directory):
                 try:
-                    stderr_output = await asyncio.wait_for(process.stderr.read(), timeout=1.0)
-                    error_msg = stderr_output.decode('utf-8').strip()
-                    logger.error(f"Claude stderr: {error_msg}")
-                except:
-                    logger.error("Could not read Claude stderr")
-                
-                process.terminate()
-                raise Exception("Claude initialization failed - no system init message received")
-            
+                    process = self._warm_pool.get_nowait()
+                    logger.info(f"Using prewarmed Claude process for session {session_id}")
+                    asyncio.create_task(self._refill_warm_pool())
+                except asyncio.QueueEmpty:
+                    process = None
+
+            if process is None:
+                process = await self._spawn_process(working_directory)
+                self.claude_processes[session_id] = process
+                logger.info(f"Started persistent Claude process for session {session_id}")
+
+                # 초기화 메시지 읽기 및 검증 (웜 풀 프로세스는 이미 끝냄)
+                init_success = await self._read_initial_output(process)
+                if not init_success:
+                    # stderr에서 에러 메시지 확인
+                    try:
+                        stderr_output = await asyncio.wait_for(process.stderr.read(), timeout=1.0)
+                        error_msg = stderr_output.decode('utf-8').strip()
+                        logger.error(f"Claude stderr: {error_msg}")
+                    except:
+                        logger.error("Could not read Claude stderr")
+
+                    process.terminate()
+                    raise Exception("Claude initialization failed - no system init message received")
+            else:
+                self.claude_processes[session_id] = process
+
+            # stdin 전담 펌프 시작
+            queue: asyncio.Queue = asyncio.Queue()
+            self._stdin_queues[session_id] = queue
+            self._stdin_tasks[session_id] = asyncio.create_task(
+                self._stdin_pump(process, queue)
+            )
+
         except Exception as e:
             logger.error(f"Failed to start Claude process for session {session_id}: {e}")
             if session_id in self.sessions:
                 del self.sessions[session_id]
             raise
-        
+
         return session_id
-    
+
     def _get_environment(self) -> Dict[str, str]:
         """환경변수 설정"""
-        import os
         env = os.environ.copy()
         env['HOME'] = os.path.expanduser('~')
         return env
     
+    async def _stdin_pump(self, process, queue: asyncio.Queue):
+        """큐에 들어온 메시지를 순서대로 stdin에 기록"""
+        try:
+            while True:
+                data = await queue.get()
+                if data is None:  # 종료 신호
+                    break
+                process.stdin.write(data)
+                await process.stdin.drain()
+        except (ConnectionResetError, BrokenPipeError) as e:
+            logger.warning(f"Claude stdin closed: {e}")
+        except asyncio.CancelledError:
+            pass
+
     async def _read_initial_output(self, process):
         """초기화 출력 읽기 (system init 메시지 필수)"""
         try:
@@ -102,10 +171,9 @@ class PersistentClaudeAgent(BaseAgent):
         session = self.sessions[session_id]
         
         try:
-            # 메시지를 Claude 프로세스에 전송
+            # 메시지를 stdin 펌프 큐로 전달 (쓰기 경합은 전담 태스크가 흡수)
             input_data = message + '\n'
-            process.stdin.write(input_data.encode('utf-8'))
-            await process.stdin.drain()
+            await self._stdin_queues[session_id].put(input_data.encode('utf-8'))
             
             logger.info(f"Sent message to Claude session {session_id}: {message[:50]}...")
             
@@ -127,80 +195,97 @@ class PersistentClaudeAgent(BaseAgent):
             self.executing_sessions.discard(session_id)
     
     async def _stream_output(self, process, session_id) -> AsyncGenerator[Dict[str, Any], None]:
-        """Claude 출력 스트리밍"""
-        consecutive_timeouts = 0
-        max_consecutive_timeouts = 3  # 3번 연속 타임아웃이면 종료
-        
-        while True:
-            try:
-                line = await asyncio.wait_for(process.stdout.readline(), timeout=2.0)
-                consecutive_timeouts = 0  # 성공하면 리셋
-                
-                if not line:
-                    # 프로세스가 종료되었거나 더 이상 출력이 없음
-                    if process.returncode is not None:
+        """Claude 출력 스트리밍
+
+        readline()을 줄마다 await하는 대신 64KB 청크로 읽어 로컬 버퍼에서
+        줄을 분리한다 — 출력 한 페이지당 await 횟수가 수십 배 줄어든다.
+        유휴 타임아웃은 읽기마다 wait_for 태스크를 새로 만드는 대신
+        asyncio.timeout 스코프 하나를 재예약해서 처리한다 (타이머 N개 -> 1개).
+        """
+        idle_timeout = 6.0  # 기존 2초 x 3회 연속 타임아웃과 같은 유휴 허용치
+        loop = asyncio.get_running_loop()
+        buf = bytearray()
+        turn_done = False
+        debug_on = logger.isEnabledFor(logging.DEBUG)
+
+        try:
+            async with asyncio.timeout(idle_timeout) as idle_scope:
+                while not turn_done:
+                    chunk = await process.stdout.read(STREAM_READ_CHUNK)
+                    # 출력이 있었으므로 유휴 데드라인을 뒤로 밀어줌
+                    idle_scope.reschedule(loop.time() + idle_timeout)
+
+                    if not chunk:
+                        # EOF: 프로세스가 stdout을 닫음 (보통 종료됨)
                         logger.warning(f"Claude process ended for session {session_id}")
                         break
-                    # 빈 줄이면 계속 대기
-                    continue
-            
-            except asyncio.TimeoutError:
-                consecutive_timeouts += 1
-                logger.debug(f"Stream timeout {consecutive_timeouts}/{max_consecutive_timeouts} for session {session_id}")
-                
-                if consecutive_timeouts >= max_consecutive_timeouts:
-                    logger.info(f"Stream ended after {consecutive_timeouts} consecutive timeouts for session {session_id}")
-                    break
-                continue
-            
-            output = line.decode('utf-8').strip()
-            if output:
-                logger.debug(f"Claude output: {output[:100]}...")
-                
-                try:
-                    parsed = json.loads(output)
-                    
-                    # 결과 타입에 따라 처리
-                    if parsed.get("type") == "result":
-                        yield {
-                            "type": "result",
-                            "content": parsed.get("result", ""),
-                            "is_error": parsed.get("is_error", False),
-                            "raw": parsed
-                        }
-                        break  # 결과가 나오면 이 턴 종료
-                    elif parsed.get("type") == "assistant":
-                        # 어시스턴트 응답 처리
-                        content = ""
-                        if "message" in parsed and "content" in parsed["message"]:
-                            for item in parsed["message"]["content"]:
-                                if item.get("type") == "text":
-                                    content += item.get("text", "")
-                        
-                        yield {
-                            "type": "assistant_response",
-                            "content": content,
-                            "raw": parsed
-                        }
-                    else:
-                        # 기타 시스템 메시지
-                        yield {
-                            "type": "raw_json",
-                            "content": output,
-                            "raw": parsed
-                        }
-                        
-                except json.JSONDecodeError:
-                    # JSON이 아닌 일반 텍스트
-                    yield {
-                        "type": "text",
-                        "content": output
-                    }
+
+                    buf += chunk
+
+                    # 버퍼에 쌓인 완성된 줄들을 한 번에 처리
+                    while (nl := buf.find(b'\n')) >= 0:
+                        line = bytes(buf[:nl]).strip()
+                        del buf[:nl + 1]
+
+                        if not line:
+                            continue
+                        if debug_on:
+                            logger.debug("Claude output: %.100s...", line)
+
+                        try:
+                            # bytes를 그대로 orjson에 넘김 (디코드는 텍스트 폴백에서만)
+                            parsed = orjson.loads(line)
+
+                            # 결과 타입에 따라 처리
+                            if parsed.get("type") == "result":
+                                yield {
+                                    "type": "result",
+                                    "content": parsed.get("result", ""),
+                                    "is_error": parsed.get("is_error", False),
+                                    "raw": parsed
+                                }
+                                turn_done = True  # 결과가 나오면 이 턴 종료
+                                break
+                            elif parsed.get("type") == "assistant":
+                                # 어시스턴트 응답 처리
+                                content = ""
+                                if "message" in parsed and "content" in parsed["message"]:
+                                    for item in parsed["message"]["content"]:
+                                        if item.get("type") == "text":
+                                            content += item.get("text", "")
+
+                                yield {
+                                    "type": "assistant_response",
+                                    "content": content,
+                                    "raw": parsed
+                                }
+                            else:
+                                # 기타 시스템 메시지
+                                yield {
+                                    "type": "raw_json",
+                                    "content": line.decode('utf-8', errors='ignore'),
+                                    "raw": parsed
+                                }
+
+                        except orjson.JSONDecodeError:
+                            # JSON이 아닌 일반 텍스트
+                            yield {
+                                "type": "text",
+                                "content": line.decode('utf-8', errors='ignore')
+                            }
+        except TimeoutError:
+            logger.info(f"Stream idle for {idle_timeout}s, ending turn for session {session_id}")
     
     async def terminate_session(self, session_id: str) -> bool:
         """세션 및 Claude 프로세스 종료"""
         success = await super().terminate_session(session_id)
         
+        # stdin 펌프 정리
+        task = self._stdin_tasks.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+        self._stdin_queues.pop(session_id, None)
+
         if session_id in self.claude_processes:
             try:
                 process = self.claude_processes[session_id]
@@ -1,116 +1,200 @@
 import asyncio
 import pty
 import os
-import select
+import re
 import termios
 import logging
 import json
+from dataclasses import dataclass
 from typing import Dict, Any, AsyncGenerator, Optional
-from agent_system import BaseAgent, Session
+from agent_system import BaseAgent, Session, STREAM_LIMIT, STREAM_READ_CHUNK
 
 logger = logging.getLogger(__name__)
 
+# Claude 프롬프트/배너 감지용 (디코드 없이 바이트에서 바로 검색)
+_INIT_RE = re.compile(rb'>|Claude')
+
+@dataclass(slots=True)
+class PTYSession:
+    """세션당 PTY 상태
+
+    문자열 키 dict 대신 슬롯 객체로 보관 — 세션당 __dict__ 오버헤드가
+    없어지고 스트리밍 루프의 필드 접근이 해시 조회 대신 슬롯 로드가 된다.
+    """
+    master_fd: int
+    pid: int
+    process: Optional[asyncio.subprocess.Process]
+    working_directory: str
+    buffer: bytes = b''
+    reader: Optional[asyncio.StreamReader] = None
+    read_transport: Optional[asyncio.BaseTransport] = None
+
 class PTYClaudeAgent(BaseAgent):
     """PTY(pseudo-terminal)를 사용한 Claude 에이전트"""
-    
-    def __init__(self, config):
+
+    def __init__(self, config, warm_pool_size: int = None):
         super().__init__(config)
-        self.pty_sessions: Dict[str, Dict] = {}  # session_id -> {master_fd, pid, buffer}
-    
+        self.pty_sessions: Dict[str, PTYSession] = {}  # session_id -> PTYSession
+
+        # 미리 띄워둔 Claude 프로세스 풀 (CLI 부팅 시간을 세션 생성 경로에서 제거)
+        if warm_pool_size is None:
+            warm_pool_size = int(os.getenv('PTY_WARM_POOL', 0))
+        self.warm_pool_size = warm_pool_size
+        self._warm_pool: asyncio.Queue = asyncio.Queue(maxsize=max(warm_pool_size, 1))
+
+    def _default_working_directory(self) -> str:
+        return self.config.working_directory or os.getcwd()
+
+    async def _spawn_pty(self, working_directory: str = None) -> PTYSession:
+        """PTY 마스터/슬레이브를 만들고 Claude 프로세스를 띄움
+
+        os.fork + bash -c 대신 create_subprocess_exec로 슬레이브를
+        표준 입출력에 물려 실행한다 — fork의 인터프리터 힙 페이지 테이블
+        복사와 셸 한 단계를 모두 건너뛰고, 종료 수거는 asyncio의
+        자식 워처가 맡는다.
+        """
+        master_fd, slave_fd = pty.openpty()
+
+        env = os.environ.copy()
+        env['HOME'] = os.path.expanduser('~')
+        env['TERM'] = 'xterm-256color'
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.config.executable_path,
+                '--print',
+                '--output-format=stream-json',
+                '--verbose',
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                cwd=working_directory or None,
+                env=env,
+                start_new_session=True
+            )
+        except Exception:
+            os.close(master_fd)
+            raise
+        finally:
+            # 부모 쪽 슬레이브 fd는 자식이 물려받은 뒤 닫음
+            os.close(slave_fd)
+
+        # 논블로킹 모드 설정
+        os.set_blocking(master_fd, False)
+
+        return PTYSession(
+            master_fd=master_fd,
+            pid=process.pid,
+            process=process,
+            working_directory=working_directory or os.getcwd()
+        )
+
+    async def _connect_reader(self, pty_info: PTYSession):
+        """master_fd를 이벤트 루프에 등록해 epoll 기반으로 읽음
+
+        select + sleep(0.1) 폴링은 청크당 최소 100ms 지연을 강제하고
+        select 동안 루프를 막는다. StreamReader로 붙이면 커널 readiness가
+        바로 읽기를 깨워 폴링 지연이 사라진다.
+        """
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=STREAM_LIMIT)
+        protocol = asyncio.StreamReaderProtocol(reader)
+        # closefd=False: fd 수명은 terminate_session이 관리
+        pipe = os.fdopen(pty_info.master_fd, 'rb', 0, closefd=False)
+        transport, _ = await loop.connect_read_pipe(lambda: protocol, pipe)
+        pty_info.reader = reader
+        pty_info.read_transport = transport
+
+    async def prewarm(self, count: int = None):
+        """Claude 프로세스를 미리 띄워 풀에 보관 (첫 응답 지연 단축)"""
+        count = self.warm_pool_size if count is None else count
+
+        for _ in range(count):
+            if self._warm_pool.full():
+                break
+            try:
+                pty_info = await self._spawn_pty(self.config.working_directory)
+                await self._connect_reader(pty_info)
+                await self._wait_for_pty_init(pty_info)
+                await self._warm_pool.put(pty_info)
+                logger.info(f"Prewarmed Claude PTY process with PID {pty_info.pid}")
+            except Exception as e:
+                logger.warning(f"Failed to prewarm Claude PTY process: {e}")
+                break
+
+    async def _refill_warm_pool(self):
+        """웜 프로세스를 꺼내 쓴 뒤 백그라운드에서 풀 보충"""
+        try:
+            await self.prewarm(1)
+        except Exception as e:
+            logger.warning(f"Failed to refill warm pool: {e}")
+
     async def create_session(self, user_id: str, working_directory: str = None) -> str:
         """PTY 세션 생성"""
         session_id = await super().create_session(user_id, working_directory)
-        
+
         try:
-            # PTY 마스터/슬레이브 쌍 생성
-            master_fd, slave_fd = pty.openpty()
-            
-            # Claude 프로세스를 PTY 슬레이브에서 실행
-            pid = os.fork()
-            
-            if pid == 0:  # 자식 프로세스
-                # 슬레이브를 표준 입출력으로 설정
-                os.close(master_fd)
-                os.dup2(slave_fd, 0)  # stdin
-                os.dup2(slave_fd, 1)  # stdout 
-                os.dup2(slave_fd, 2)  # stderr
-                os.close(slave_fd)
-                
-                # 작업 디렉토리 변경
-                if working_directory:
-                    os.chdir(working_directory)
-                
-                # 환경변수 설정
-                env = os.environ.copy()
-                env['HOME'] = os.path.expanduser('~')
-                env['TERM'] = 'xterm-256color'
-                
-                # Claude를 --print 모드로 실행
-                claude_cmd = f'{self.config.executable_path} --print --output-format=stream-json --verbose'
-                os.execve(
-                    '/bin/bash',
-                    ['bash', '-c', claude_cmd],
-                    env
-                )
-            else:  # 부모 프로세스
-                os.close(slave_fd)
-                
-                # 논블로킹 모드 설정
-                os.set_blocking(master_fd, False)
-                
-                # 세션 정보 저장
-                self.pty_sessions[session_id] = {
-                    'master_fd': master_fd,
-                    'pid': pid,
-                    'buffer': b'',
-                    'working_directory': working_directory or os.getcwd()
-                }
-                
-                logger.info(f"Started PTY Claude session {session_id} with PID {pid}")
-                
+            # 기본 작업 디렉토리라면 웜 풀의 프로세스를 재사용
+            pty_info = None
+            if not working_directory or working_directory == self._default_working_directory():
+                try:
+                    pty_info = self._warm_pool.get_nowait()
+                except asyncio.QueueEmpty:
+                    pty_info = None
+
+            if pty_info is not None:
+                self.pty_sessions[session_id] = pty_info
+                logger.info(f"Reused warm PTY Claude process PID {pty_info.pid} for session {session_id}")
+                if self.warm_pool_size > 0:
+                    asyncio.create_task(self._refill_warm_pool())
+            else:
+                pty_info = await self._spawn_pty(working_directory)
+                await self._connect_reader(pty_info)
+                self.pty_sessions[session_id] = pty_info
+                logger.info(f"Started PTY Claude session {session_id} with PID {pty_info.pid}")
+
                 # 초기화 대기 (Claude 시작 메시지)
-                await self._wait_for_initialization(session_id)
-                
+                await self._wait_for_pty_init(pty_info)
+
         except Exception as e:
             logger.error(f"Failed to create PTY session {session_id}: {e}")
             if session_id in self.sessions:
                 del self.sessions[session_id]
             raise
-        
+
         return session_id
-    
-    async def _wait_for_initialization(self, session_id: str, timeout: float = 10.0):
-        """Claude 초기화 대기"""
-        pty_info = self.pty_sessions[session_id]
-        master_fd = pty_info['master_fd']
-        
-        start_time = asyncio.get_event_loop().time()
-        buffer = b''
-        
+
+    async def _wait_for_pty_init(self, pty_info: PTYSession, timeout: float = 10.0):
+        """Claude 초기화 대기 (readiness 기반: 폴링 없이 도착 즉시 깨어남)"""
+        reader = pty_info.reader
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        buffer = bytearray()  # += 시 재할당 없이 제자리 확장
+
         while True:
-            # 타임아웃 체크
-            if asyncio.get_event_loop().time() - start_time > timeout:
-                logger.warning(f"Claude initialization timeout for session {session_id}")
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.warning(f"Claude initialization timeout for PID {pty_info.pid}")
                 break
-            
-            # 데이터 읽기 시도
+
             try:
-                ready, _, _ = select.select([master_fd], [], [], 0.1)
-                if ready:
-                    data = os.read(master_fd, 1024)
-                    if data:
-                        buffer += data
-                        text = buffer.decode('utf-8', errors='ignore')
-                        
-                        # Claude 프롬프트나 초기화 메시지 확인
-                        if '>' in text or 'Claude' in text or len(buffer) > 100:
-                            logger.info(f"Claude initialized for session {session_id}")
-                            pty_info['buffer'] = buffer
-                            break
-                else:
-                    await asyncio.sleep(0.1)
-            except (OSError, UnicodeDecodeError):
-                await asyncio.sleep(0.1)
+                data = await asyncio.wait_for(reader.read(STREAM_READ_CHUNK), remaining)
+            except asyncio.TimeoutError:
+                logger.warning(f"Claude initialization timeout for PID {pty_info.pid}")
+                break
+            except OSError:
+                break
+
+            if not data:  # EOF
+                break
+
+            buffer += data
+
+            # Claude 프롬프트나 초기화 메시지 확인 (UTF-8 디코드 없이 검사)
+            if _INIT_RE.search(buffer) or len(buffer) > 100:
+                logger.info(f"Claude initialized for PID {pty_info.pid}")
+                pty_info.buffer = bytes(buffer)
+                break
     
     async def execute_command(self, session_id: str, message: str) -> AsyncGenerator[Dict[str, Any], None]:
         """PTY 세션에서 명령 실행"""
@@ -119,18 +203,22 @@ class PTYClaudeAgent(BaseAgent):
             return
         
         pty_info = self.pty_sessions[session_id]
-        master_fd = pty_info['master_fd']
+        master_fd = pty_info.master_fd
         
         try:
             # 명령 전송
             command = message + '\n'
             os.write(master_fd, command.encode('utf-8'))
             logger.info(f"Sent command to PTY session {session_id}: {message[:50]}...")
-            
-            # 응답 스트리밍
+
+            # 응답 스트리밍 — 프레임마다 붙는 태그는 루프 밖에서 한 번만 구성
+            # (Enum .value 접근과 개별 dict 저장을 프레임당 반복하지 않음)
+            tag = {
+                "session_id": session_id,
+                "agent_type": self.config.agent_type.value
+            }
             async for output in self._stream_pty_output(session_id):
-                output["session_id"] = session_id
-                output["agent_type"] = self.config.agent_type.value
+                output.update(tag)
                 yield output
                 
         except Exception as e:
@@ -142,65 +230,112 @@ class PTYClaudeAgent(BaseAgent):
             }
     
     async def _stream_pty_output(self, session_id: str) -> AsyncGenerator[Dict[str, Any], None]:
-        """PTY 출력 스트리밍"""
+        """PTY 출력 스트리밍 (readiness 기반, 유휴 5초면 턴 종료)
+
+        읽기와 yield를 한 코루틴에 묶으면 소비 측(SSE/텔레그램 전송)이
+        밀릴 때 PTY 드레인도 같이 멈추고 커널 버퍼가 차서 자식 프로세스가
+        역압을 받는다. 유계 큐를 사이에 두어 전송이 느려도 PTY는 계속
+        비우고, 큐가 가득 차면 가장 오래된 이벤트를 버리고 lagged
+        마커로 알린다 (메모리 상한 유지).
+        """
         pty_info = self.pty_sessions[session_id]
-        master_fd = pty_info['master_fd']
-        
-        buffer = b''
-        consecutive_empty_reads = 0
-        max_empty_reads = 50  # 5초 (0.1초 * 50)
-        
-        try:
-            while consecutive_empty_reads < max_empty_reads:
-                try:
-                    # select를 사용해서 데이터 대기
-                    ready, _, _ = select.select([master_fd], [], [], 0.1)
-                    
-                    if ready:
-                        data = os.read(master_fd, 1024)
-                        if data:
-                            consecutive_empty_reads = 0
-                            buffer += data
-                            
-                            # 라인별로 처리
-                            while b'\n' in buffer:
-                                line, buffer = buffer.split(b'\n', 1)
-                                text = line.decode('utf-8', errors='ignore').strip()
-                                
-                                if text:
-                                    # 일반 텍스트 출력
-                                    yield {
-                                        "type": "text",
-                                        "content": text,
-                                        "timestamp": asyncio.get_event_loop().time()
-                                    }
+        reader = pty_info.reader
+
+        idle_timeout = 5.0  # 기존 0.1초 x 50회 빈 읽기와 같은 유휴 허용치
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+        dropped = 0  # 오버플로로 폐기한 이벤트 수 (소비 측에 마커로 보고)
+
+        def put_event(event: Dict[str, Any]):
+            nonlocal dropped
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                queue.get_nowait()  # 가장 오래된 이벤트부터 폐기
+                dropped += 1
+                queue.put_nowait(event)
+
+        async def drain_pty():
+            buffer = bytearray()
+            try:
+                while True:
+                    try:
+                        data = await asyncio.wait_for(reader.read(STREAM_READ_CHUNK), idle_timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    except OSError as e:
+                        if e.errno == 5:  # Input/output error (process terminated)
+                            logger.info(f"PTY process terminated for session {session_id}")
+                            break
                         else:
-                            consecutive_empty_reads += 1
-                    else:
-                        consecutive_empty_reads += 1
-                        await asyncio.sleep(0.1)
-                        
-                except OSError as e:
-                    if e.errno == 5:  # Input/output error (process terminated)
+                            logger.error(f"PTY read error: {e}")
+                            break
+
+                    if not data:  # EOF
                         logger.info(f"PTY process terminated for session {session_id}")
                         break
-                    else:
-                        logger.error(f"PTY read error: {e}")
-                        break
-            
-            # 남은 버퍼 내용 출력
-            if buffer:
-                text = buffer.decode('utf-8', errors='ignore').strip()
-                if text:
+
+                    buffer += data
+
+                    # 마지막 개행까지를 한 번에 잘라 라인 분리 —
+                    # split(b'\n', 1) 반복은 꼬리를 매번 재할당해 O(N^2)이 된다
+                    idx = buffer.rfind(b'\n')
+                    if idx < 0:
+                        continue
+                    lines = bytes(buffer[:idx]).split(b'\n')
+                    del buffer[:idx + 1]  # bytearray 앞부분 제거는 제자리 연산
+
+                    # 같은 드레인에서 나온 라인들은 타임스탬프를 공유
+                    # (라인마다 clock 호출을 하지 않음)
+                    ts = loop.time()
+                    for line in lines:
+                        text = line.decode('utf-8', errors='ignore').strip()
+
+                        if text:
+                            # 일반 텍스트 출력
+                            put_event({
+                                "type": "text",
+                                "content": text,
+                                "timestamp": ts
+                            })
+
+                # 남은 버퍼 내용 출력
+                if buffer:
+                    text = buffer.decode('utf-8', errors='ignore').strip()
+                    if text:
+                        put_event({
+                            "type": "text",
+                            "content": text,
+                            "timestamp": loop.time()
+                        })
+            finally:
+                # 종료 신호는 이벤트와 달리 버리면 안 되므로 블로킹 put
+                await queue.put(None)
+
+        drain_task = asyncio.create_task(drain_pty())
+        reported = 0
+
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+
+                if dropped > reported:
                     yield {
-                        "type": "text", 
-                        "content": text,
-                        "timestamp": asyncio.get_event_loop().time()
+                        "type": "lagged",
+                        "dropped": dropped - reported,
+                        "timestamp": loop.time()
                     }
-                    
+                    reported = dropped
+
+                yield event
+
         except Exception as e:
             logger.error(f"Error streaming PTY output: {e}")
             yield {"error": f"Stream error: {str(e)}"}
+        finally:
+            drain_task.cancel()
     
     async def terminate_session(self, session_id: str) -> bool:
         """PTY 세션 종료"""
@@ -209,18 +344,31 @@ class PTYClaudeAgent(BaseAgent):
         if session_id in self.pty_sessions:
             try:
                 pty_info = self.pty_sessions[session_id]
-                master_fd = pty_info['master_fd']
-                pid = pty_info['pid']
+                master_fd = pty_info.master_fd
+                pid = pty_info.pid
                 
-                # 프로세스 종료
+                # 프로세스 종료: SIGTERM 후 종료를 기다리고,
+                # 제한 시간 내에 안 죽으면 그때만 SIGKILL로 격상
+                process = pty_info.process
                 try:
-                    os.kill(pid, 15)  # SIGTERM
-                    await asyncio.sleep(0.5)
-                    os.kill(pid, 9)   # SIGKILL (강제 종료)
+                    if process is not None:
+                        process.terminate()
+                        try:
+                            await asyncio.wait_for(process.wait(), 0.5)
+                        except asyncio.TimeoutError:
+                            process.kill()
+                            await process.wait()
+                    else:
+                        os.kill(pid, 15)  # SIGTERM
+                        await asyncio.sleep(0.5)
+                        os.kill(pid, 9)   # SIGKILL (강제 종료)
                 except ProcessLookupError:
                     pass  # 이미 종료됨
                 
-                # 파일 디스크립터 닫기
+                # 리더 트랜스포트 해제 후 파일 디스크립터 닫기
+                transport = pty_info.read_transport
+                if transport is not None:
+                    transport.close()
                 os.close(master_fd)
                 
                 del self.pty_sessions[session_id]
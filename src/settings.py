@@ -0,0 +1,30 @@
+"""환경 변수 로딩과 공통 설정의 단일 진입점
+
+.env 파싱(load_dotenv)은 이 모듈을 처음 임포트할 때 한 번만 수행되고,
+각 모듈은 os.getenv를 반복 호출하는 대신 settings 인스턴스를 참조한다.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+from dotenv import load_dotenv
+
+# .env는 프로세스당 한 번만 파싱
+if not os.getenv('_ENV_LOADED'):
+    load_dotenv()
+    os.environ['_ENV_LOADED'] = '1'
+
+@dataclass(frozen=True)
+class Settings:
+    """환경 변수 기반 설정 (모듈 임포트 시 한 번만 파싱)"""
+    executor_port: int = int(os.getenv('EXECUTOR_PORT', 8001))
+    # 설정 시 브리지-서버 간 통신이 루프백 TCP 대신 유닉스 소켓을 사용
+    agent_server_socket: Optional[str] = os.getenv('AGENT_SERVER_SOCKET')
+    claude_code_path: str = os.getenv('CLAUDE_CODE_PATH', 'claude')
+    gemini_cli_path: Optional[str] = os.getenv('GEMINI_CLI_PATH')
+    session_timeout: int = int(os.getenv('SESSION_TIMEOUT', 3600))
+    max_sessions: int = int(os.getenv('MAX_SESSIONS', 10))
+    telegram_bot_token: Optional[str] = os.getenv('TELEGRAM_BOT_TOKEN')
+    allowed_user_ids: str = os.getenv('ALLOWED_USER_IDS', '')
+
+settings = Settings()
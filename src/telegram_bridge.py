@@ -1,35 +1,103 @@
 import asyncio
 import logging
-import json
+import orjson
 import aiohttp
 from typing import Dict, Optional
 from datetime import datetime
 import os
-from dotenv import load_dotenv
 
 from telegram import Update, Bot
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from src.config import config
-
-load_dotenv()
+from config import config
+from settings import settings
 
 logger = logging.getLogger(__name__)
 
+# 출력 배치 플러시 기준: 이 크기를 넘거나, 이 시간 동안 새 이벤트가 없으면 전송
+TG_FLUSH_SIZE = 3500
+TG_FLUSH_IDLE = 1.0  # Telegram 편집/전송 레이트 리밋을 고려한 유휴 플러시 주기
+
+# 정적 응답 텍스트는 호출마다 조립하지 않고 모듈 로드 시 한 번만 구성
+_WELCOME_MESSAGE = """
+🤖 **원격 에이전트 실행 봇**에 오신 것을 환영합니다!
+
+**사용 가능한 명령어:**
+• `/start` - 봇 시작
+• `/help` - 도움말 보기
+• `/agents` - 사용 가능한 에이전트 목록
+• `/new [에이전트] [디렉토리]` - 새 세션 시작
+• `/switch [에이전트]` - 에이전트 변경
+• `/status` - 현재 세션 상태 확인
+• `/end` - 현재 세션 종료
+
+메시지를 보내면 선택한 에이전트가 실행됩니다.
+        """
+
+_HELP_TEXT = """
+📖 **원격 에이전트 실행 봇 사용법**
+
+**기본 명령어:**
+• `/start` - 봇 시작 및 기본 세션 생성
+• `/help` - 이 도움말 보기
+• `/agents` - 사용 가능한 에이전트 목록 확인
+• `/new [에이전트] [디렉토리]` - 새 세션 시작
+• `/switch [에이전트]` - 다른 에이전트로 변경
+• `/status` - 현재 세션 상태 확인
+• `/end` - 현재 세션 종료
+
+**사용 방법:**
+1. `/agents` 명령으로 사용 가능한 에이전트 확인
+2. `/new claude_code` 또는 `/new gemini_cli`로 원하는 에이전트 선택
+3. 일반 메시지를 보내면 해당 에이전트가 실행됩니다
+
+**예시:**
+• `/new claude_code /home/user/project` - Claude Code로 특정 디렉토리에서 세션 시작
+• `/switch gemini_cli` - Gemini CLI로 에이전트 변경
+• "프로젝트의 README 파일을 작성해줘" - 에이전트에게 작업 요청
+
+**지원하는 에이전트:**
+• `claude_code` - Claude Code (기본)
+• `gemini_cli` - Gemini CLI
+• 기타 등록된 커스텀 에이전트
+
+**주의사항:**
+• 한 번에 하나의 명령만 실행 가능합니다
+• 세션은 1시간 후 자동 종료됩니다
+• 에이전트별로 별도 세션이 관리됩니다
+        """
+
+# 상태 메시지는 동적 필드만 채우도록 format 템플릿을 바운드 메서드로 고정
+_STATUS_TEMPLATE = """
+📊 **세션 상태**
+• 에이전트: `{agent_type}`
+• 세션 ID: `{session_id}`
+• 생성 시간: `{created_at}`
+• 작업 디렉토리: `{working_directory}`
+• 실행 상태: {execution_state}
+            """.format
+
 class TelegramBridge:
     def __init__(self):
-        self.token = os.getenv('TELEGRAM_BOT_TOKEN')
-        self.agent_server_url = f"http://localhost:{os.getenv('EXECUTOR_PORT', 8001)}"
+        self.token = settings.telegram_bot_token
+        self.agent_server_url = f"http://localhost:{settings.executor_port}"
         self.user_sessions: Dict[str, str] = {}  # user_id -> session_id
         self.user_agents: Dict[str, str] = {}    # user_id -> agent_type
         self.active_executions: Dict[str, bool] = {}  # user_id -> is_executing
-        
-        # 허용된 사용자 ID 로드
-        allowed_users_str = os.getenv('ALLOWED_USER_IDS', '')
-        self.allowed_users = set(allowed_users_str.split(',')) if allowed_users_str else set()
+        self._http_session: Optional[aiohttp.ClientSession] = None  # 에이전트 서버용 공유 세션
+        
+        # 허용된 사용자 ID 로드 (모든 콜백에서 조회하므로 int frozenset으로 고정)
+        allowed_users = set()
+        if settings.allowed_user_ids:
+            for part in settings.allowed_user_ids.split(','):
+                part = part.strip()
+                if not part:
+                    continue
+                try:
+                    allowed_users.add(int(part))
+                except ValueError:
+                    logger.warning(f"Ignoring non-numeric user id in ALLOWED_USER_IDS: {part!r}")
+        self.allowed_users = frozenset(allowed_users)
         
         if not self.token:
             raise ValueError("TELEGRAM_BOT_TOKEN is required")
@@ -47,19 +115,36 @@ class TelegramBridge:
         self.application.add_handler(CommandHandler("end", self.end_session_command))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
     
-    def _is_user_allowed(self, user_id: str) -> bool:
+    def _get_http_session(self) -> aiohttp.ClientSession:
+        """에이전트 서버 호출에 재사용하는 HTTP 세션 반환
+
+        호출마다 ClientSession을 새로 만들면 매번 TCP 핸드셰이크 비용이
+        발생하므로, keep-alive 커넥션 풀을 가진 세션 하나를 재사용한다.
+        """
+        if self._http_session is None or self._http_session.closed:
+            # 같은 호스트의 서버라 유닉스 소켓이 있으면 루프백 TCP를 우회
+            # (TCP 프레이밍/체크섬 비용 제거), 없으면 TCP로 폴백
+            sock_path = settings.agent_server_socket
+            if sock_path and os.path.exists(sock_path):
+                connector = aiohttp.UnixConnector(path=sock_path)
+            else:
+                connector = aiohttp.TCPConnector(limit=50, keepalive_timeout=30)
+            self._http_session = aiohttp.ClientSession(connector=connector)
+        return self._http_session
+
+    def _is_user_allowed(self, user_id: int) -> bool:
         """사용자 접근 권한 확인"""
         # 허용된 사용자 목록이 비어있으면 모든 사용자 허용 (개발 모드)
         if not self.allowed_users:
             logger.warning(f"Access control not configured. User {user_id} accessing bot.")
             return True
         return user_id in self.allowed_users
-    
+
     async def _check_access(self, update: Update) -> bool:
         """접근 권한 확인 및 거부 메시지 전송"""
-        user_id = str(update.effective_user.id)
+        user_id = update.effective_user.id  # Telegram은 int ID를 줌
         user_name = update.effective_user.username or update.effective_user.first_name
-        
+
         if not self._is_user_allowed(user_id):
             logger.warning(f"Unauthorized access attempt from user {user_id} ({user_name})")
             await update.message.reply_text(
@@ -76,21 +161,7 @@ class TelegramBridge:
             return
         
         user_id = str(update.effective_user.id)
-        welcome_message = """
-🤖 **원격 에이전트 실행 봇**에 오신 것을 환영합니다!
-
-**사용 가능한 명령어:**
-• `/start` - 봇 시작
-• `/help` - 도움말 보기
-• `/agents` - 사용 가능한 에이전트 목록
-• `/new [에이전트] [디렉토리]` - 새 세션 시작
-• `/switch [에이전트]` - 에이전트 변경
-• `/status` - 현재 세션 상태 확인
-• `/end` - 현재 세션 종료
-
-메시지를 보내면 선택한 에이전트가 실행됩니다.
-        """
-        await update.message.reply_text(welcome_message, parse_mode='Markdown')
+        await update.message.reply_text(_WELCOME_MESSAGE, parse_mode='Markdown')
         
         # 기본 에이전트로 세션 생성 (Claude Code)
         await self._create_session_for_user(user_id, "claude_code")
@@ -99,39 +170,7 @@ class TelegramBridge:
         """도움말 명령 처리"""
         if not await self._check_access(update):
             return
-        help_text = """
-📖 **원격 에이전트 실행 봇 사용법**
-
-**기본 명령어:**
-• `/start` - 봇 시작 및 기본 세션 생성
-• `/help` - 이 도움말 보기
-• `/agents` - 사용 가능한 에이전트 목록 확인
-• `/new [에이전트] [디렉토리]` - 새 세션 시작
-• `/switch [에이전트]` - 다른 에이전트로 변경
-• `/status` - 현재 세션 상태 확인
-• `/end` - 현재 세션 종료
-
-**사용 방법:**
-1. `/agents` 명령으로 사용 가능한 에이전트 확인
-2. `/new claude_code` 또는 `/new gemini_cli`로 원하는 에이전트 선택
-3. 일반 메시지를 보내면 해당 에이전트가 실행됩니다
-
-**예시:**
-• `/new claude_code /home/user/project` - Claude Code로 특정 디렉토리에서 세션 시작
-• `/switch gemini_cli` - Gemini CLI로 에이전트 변경
-• "프로젝트의 README 파일을 작성해줘" - 에이전트에게 작업 요청
-
-**지원하는 에이전트:**
-• `claude_code` - Claude Code (기본)
-• `gemini_cli` - Gemini CLI
-• 기타 등록된 커스텀 에이전트
-
-**주의사항:**
-• 한 번에 하나의 명령만 실행 가능합니다
-• 세션은 1시간 후 자동 종료됩니다
-• 에이전트별로 별도 세션이 관리됩니다
-        """
-        await update.message.reply_text(help_text, parse_mode='Markdown')
+        await update.message.reply_text(_HELP_TEXT, parse_mode='Markdown')
     
     async def list_agents_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """사용 가능한 에이전트 목록"""
@@ -238,14 +277,13 @@ class TelegramBridge:
             is_executing = self.active_executions.get(user_id, False)
             agent_type = self.user_agents.get(user_id, "unknown")
             
-            status_msg = f"""
-📊 **세션 상태**
-• 에이전트: `{agent_type}`
-• 세션 ID: `{session_id}`
-• 생성 시간: `{session_info.get('created_at', 'N/A')}`
-• 작업 디렉토리: `{session_info.get('working_directory', 'N/A')}`
-• 실행 상태: {'🔄 실행 중' if is_executing else '✅ 대기 중'}
-            """
+            status_msg = _STATUS_TEMPLATE(
+                agent_type=agent_type,
+                session_id=session_id,
+                created_at=session_info.get('created_at', 'N/A'),
+                working_directory=session_info.get('working_directory', 'N/A'),
+                execution_state='🔄 실행 중' if is_executing else '✅ 대기 중'
+            )
         else:
             status_msg = "❌ 세션 정보를 가져올 수 없습니다."
         
@@ -294,76 +332,105 @@ class TelegramBridge:
         try:
             # 실행 시작 알림
             status_message = await update.message.reply_text(f"🔄 {agent_type} 실행 중...")
-            
-            # 에이전트 실행
-            output_messages = []
-            async for output in self._execute_command(session_id, message_text):
+
+            # 출력 전체를 모았다가 join하는 대신 조각 리스트에 누적하고,
+            # 청크 한도를 넘을 때마다 바로 전송 (전체 출력의 2중 복사 제거)
+            chunk_limit = 4000
+            pieces = []   # 출력 조각 (join은 청크 전송 시에만 수행)
+            pending = 0   # pieces에 쌓인 총 문자 수 (개행 포함)
+            sent_chunks = 0
+            errored = False
+
+            async def send_chunk(text: str):
+                # 청크는 항상 send_message로 전달 — edit는 펜딩 편집과
+                # 직렬화되어 send보다 비싸므로 상태 메시지 편집은
+                # 시작/종료 시 한 번씩만 수행
+                nonlocal sent_chunks
+                sent_chunks += 1
+                await context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text=f"📤 **{agent_type} 출력** ({sent_chunks}):\n\n```\n{text}\n```",
+                    parse_mode='Markdown'
+                )
+
+            # 스트림을 펌프 태스크로 받아 큐로 전달하고, 소비 측에서
+            # 크기(TG_FLUSH_SIZE) 또는 유휴(TG_FLUSH_IDLE) 기준으로 플러시
+            queue: asyncio.Queue = asyncio.Queue()
+
+            async def pump():
                 try:
-                    if isinstance(output, str):
-                        data = json.loads(output)
-                    else:
-                        data = output
-                    
-                    if "error" in data:
-                        await context.bot.edit_message_text(
-                            chat_id=update.effective_chat.id,
-                            message_id=status_message.message_id,
-                            text=f"❌ 오류: {data['error']}"
-                        )
+                    async for output in self._execute_command(session_id, message_text):
+                        await queue.put(output)
+                finally:
+                    await queue.put(None)
+
+            pump_task = asyncio.create_task(pump())
+
+            try:
+                while True:
+                    try:
+                        if pending:
+                            output = await asyncio.wait_for(queue.get(), TG_FLUSH_IDLE)
+                        else:
+                            output = await queue.get()
+                    except asyncio.TimeoutError:
+                        # 유휴 상태: 쌓인 출력을 바로 내보내 체감 지연을 제한
+                        await send_chunk("\n".join(pieces))
+                        pieces = []
+                        pending = 0
+                        continue
+
+                    if output is None:
                         break
-                    elif "content" in data:
-                        output_messages.append(data['content'])
-                    elif "type" in data and data["type"] == "text":
-                        output_messages.append(data.get('content', str(data)))
-                    
-                except json.JSONDecodeError:
-                    # JSON이 아닌 일반 텍스트
-                    output_messages.append(str(output))
-                except Exception as e:
-                    logger.error(f"Error parsing output: {e}")
-                    continue
-            
-            # 모든 출력 합치기
-            if output_messages:
-                full_output = "\n".join(output_messages)
-                
-                # 메시지 길이 제한 처리
-                if len(full_output) > 4000:
-                    chunks = [full_output[i:i+4000] for i in range(0, len(full_output), 4000)]
-                    
-                    await context.bot.edit_message_text(
-                        chat_id=update.effective_chat.id,
-                        message_id=status_message.message_id,
-                        text=f"📤 **{agent_type} 출력** (1/{len(chunks)}):\n\n```\n{chunks[0]}\n```",
-                        parse_mode='Markdown'
-                    )
-                    
-                    for i, chunk in enumerate(chunks[1:], 2):
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=f"📤 **{agent_type} 출력** ({i}/{len(chunks)}):\n\n```\n{chunk}\n```",
-                            parse_mode='Markdown'
-                        )
-                else:
-                    await context.bot.edit_message_text(
-                        chat_id=update.effective_chat.id,
-                        message_id=status_message.message_id,
-                        text=f"📤 **{agent_type} 출력:**\n\n```\n{full_output}\n```",
-                        parse_mode='Markdown'
-                    )
-            else:
+
+                    try:
+                        data = output  # _execute_command가 항상 dict를 yield함
+
+                        if "error" in data:
+                            await context.bot.edit_message_text(
+                                chat_id=update.effective_chat.id,
+                                message_id=status_message.message_id,
+                                text=f"❌ 오류: {data['error']}"
+                            )
+                            pieces = []
+                            errored = True
+                            break
+                        elif "content" in data:
+                            pieces.append(data['content'])
+                            pending += len(data['content']) + 1
+                        elif "type" in data and data["type"] == "text":
+                            content = data.get('content', str(data))
+                            pieces.append(content)
+                            pending += len(content) + 1
+
+                    except Exception as e:
+                        logger.error(f"Error parsing output: {e}")
+                        continue
+
+                    # 한도를 넘긴 만큼은 스트리밍 중에 바로 내보냄
+                    while pending >= TG_FLUSH_SIZE:
+                        joined = "\n".join(pieces)
+                        await send_chunk(joined[:chunk_limit])
+                        remainder = joined[chunk_limit:]
+                        pieces = [remainder] if remainder else []
+                        pending = len(remainder)
+            finally:
+                pump_task.cancel()
+
+            # 남은 출력 플러시
+            if pieces:
+                remainder = "\n".join(pieces)
+                if remainder:
+                    await send_chunk(remainder)
+
+            # 종료 상태는 상태 메시지 편집 한 번으로 알림
+            if not errored:
                 await context.bot.edit_message_text(
                     chat_id=update.effective_chat.id,
                     message_id=status_message.message_id,
-                    text="✅ 실행 완료 (출력 없음)"
+                    text="✅ 실행 완료" if sent_chunks else "✅ 실행 완료 (출력 없음)"
                 )
             
-            # 실행 완료 알림
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="✅ 실행 완료"
-            )
-            
         except Exception as e:
             logger.error(f"Error handling message from user {user_id}: {e}")
             await update.message.reply_text(f"❌ 오류가 발생했습니다: {str(e)}")
@@ -374,13 +441,13 @@ class TelegramBridge:
     async def _get_available_agents(self) -> Optional[Dict]:
         """사용 가능한 에이전트 목록 조회"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.agent_server_url}/agents") as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-                    else:
-                        logger.error(f"Failed to get agents: {resp.status}")
-                        return None
+            session = self._get_http_session()
+            async with session.get(f"{self.agent_server_url}/agents") as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                else:
+                    logger.error(f"Failed to get agents: {resp.status}")
+                    return None
         except Exception as e:
             logger.error(f"Error getting agents: {e}")
             return None
@@ -388,24 +455,24 @@ class TelegramBridge:
     async def _create_session_for_user(self, user_id: str, agent_type: str, working_directory: str = None) -> Optional[str]:
         """사용자를 위한 세션 생성"""
         try:
-            async with aiohttp.ClientSession() as session:
-                data = {
-                    "agent_type": agent_type,
-                    "user_id": user_id,
-                    "working_directory": working_directory
-                }
-                
-                async with session.post(f"{self.agent_server_url}/sessions", json=data) as resp:
-                    if resp.status == 200:
-                        result = await resp.json()
-                        session_id = result["session_id"]
-                        self.user_sessions[user_id] = session_id
-                        self.user_agents[user_id] = agent_type
-                        logger.info(f"Session created for user {user_id} with agent {agent_type}: {session_id}")
-                        return session_id
-                    else:
-                        logger.error(f"Failed to create session for user {user_id}: {resp.status}")
-                        return None
+            session = self._get_http_session()
+            data = {
+                "agent_type": agent_type,
+                "user_id": user_id,
+                "working_directory": working_directory
+            }
+
+            async with session.post(f"{self.agent_server_url}/sessions", json=data) as resp:
+                if resp.status == 200:
+                    result = await resp.json()
+                    session_id = result["session_id"]
+                    self.user_sessions[user_id] = session_id
+                    self.user_agents[user_id] = agent_type
+                    logger.info(f"Session created for user {user_id} with agent {agent_type}: {session_id}")
+                    return session_id
+                else:
+                    logger.error(f"Failed to create session for user {user_id}: {resp.status}")
+                    return None
         except Exception as e:
             logger.error(f"Error creating session for user {user_id}: {e}")
             return None
@@ -418,19 +485,19 @@ class TelegramBridge:
         session_id = self.user_sessions[user_id]
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.delete(f"{self.agent_server_url}/sessions/{session_id}") as resp:
-                    if resp.status == 200:
-                        del self.user_sessions[user_id]
-                        if user_id in self.user_agents:
-                            del self.user_agents[user_id]
-                        if user_id in self.active_executions:
-                            del self.active_executions[user_id]
-                        logger.info(f"Session terminated for user {user_id}: {session_id}")
-                        return True
-                    else:
-                        logger.error(f"Failed to terminate session for user {user_id}: {resp.status}")
-                        return False
+            session = self._get_http_session()
+            async with session.delete(f"{self.agent_server_url}/sessions/{session_id}") as resp:
+                if resp.status == 200:
+                    del self.user_sessions[user_id]
+                    if user_id in self.user_agents:
+                        del self.user_agents[user_id]
+                    if user_id in self.active_executions:
+                        del self.active_executions[user_id]
+                    logger.info(f"Session terminated for user {user_id}: {session_id}")
+                    return True
+                else:
+                    logger.error(f"Failed to terminate session for user {user_id}: {resp.status}")
+                    return False
         except Exception as e:
             logger.error(f"Error terminating session for user {user_id}: {e}")
             return False
@@ -438,16 +505,16 @@ class TelegramBridge:
     async def _get_session_info(self, session_id: str) -> Optional[Dict]:
         """세션 정보 조회"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.agent_server_url}/sessions/{session_id}") as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-                    elif resp.status == 404:
-                        # 세션이 존재하지 않으면 로컬 상태에서 제거
-                        self._cleanup_invalid_session(session_id)
-                        return None
-                    else:
-                        return None
+            session = self._get_http_session()
+            async with session.get(f"{self.agent_server_url}/sessions/{session_id}") as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                elif resp.status == 404:
+                    # 세션이 존재하지 않으면 로컬 상태에서 제거
+                    self._cleanup_invalid_session(session_id)
+                    return None
+                else:
+                    return None
         except Exception as e:
             logger.error(f"Error getting session info for {session_id}: {e}")
             return None
@@ -455,20 +522,35 @@ class TelegramBridge:
     async def _execute_command(self, session_id: str, message: str):
         """명령 실행 및 스트리밍 출력"""
         try:
-            async with aiohttp.ClientSession() as session:
-                data = {
-                    "session_id": session_id,
-                    "message": message
-                }
-                
-                async with session.post(f"{self.agent_server_url}/execute", json=data) as resp:
-                    if resp.status == 200:
-                        async for line in resp.content:
-                            line_str = line.decode('utf-8').strip()
-                            if line_str.startswith('data: '):
-                                yield line_str[6:]  # 'data: ' 제거
-                    else:
-                        yield {"error": f"HTTP {resp.status}"}
+            session = self._get_http_session()
+            data = {
+                "session_id": session_id,
+                "message": message
+            }
+
+            async with session.post(f"{self.agent_server_url}/execute", json=data) as resp:
+                if resp.status == 200:
+                    # aiohttp의 줄 단위 이터레이션 대신 64KB 청크로 받아
+                    # 버퍼에서 직접 SSE 프레임을 분리 (라인당 할당/디코드 절감)
+                    buf = bytearray()
+                    async for chunk in resp.content.iter_chunked(65536):
+                        buf += chunk
+                        while (nl := buf.find(b'\n')) != -1:
+                            line = bytes(buf[:nl])
+                            del buf[:nl + 1]
+                            if line.startswith(b'data: '):
+                                # 'data: ' 제거 후 여기서 바로 dict로 파싱해
+                                # 소비 측의 타입 분기/재파싱을 없앰
+                                payload = line[6:]
+                                try:
+                                    yield orjson.loads(payload)
+                                except orjson.JSONDecodeError:
+                                    yield {
+                                        "type": "text",
+                                        "content": payload.decode('utf-8', errors='ignore')
+                                    }
+                else:
+                    yield {"error": f"HTTP {resp.status}"}
         except Exception as e:
             logger.error(f"Error executing command: {e}")
             yield {"error": str(e)}
@@ -503,10 +585,23 @@ class TelegramBridge:
         except (KeyboardInterrupt, asyncio.CancelledError):
             logger.info("Stopping Telegram Bridge...")
         finally:
+            if self._http_session and not self._http_session.closed:
+                await self._http_session.close()
             await self.application.updater.stop()
             await self.application.stop()
             await self.application.shutdown()
 
 if __name__ == "__main__":
+    import sys
+
+    # uvloop이 설치되어 있으면 기본 이벤트 루프로 사용 (Windows 미지원)
+    # SSE 프레임이 많을수록 콜백당 오버헤드 절감 효과가 커진다
+    try:
+        if sys.platform != "win32":
+            import uvloop
+            uvloop.install()
+    except ImportError:
+        pass
+
     bridge = TelegramBridge()
     asyncio.run(bridge.run())
\ No newline at end of file
@@ -5,9 +5,13 @@ subprocess 기반의 claude -p 모드 사용 테스트
 """
 
 import asyncio
+import collections
+import io
+import logging
+import re
 import sys
 import os
-from datetime import datetime
+import time
 
 # 프로젝트 경로 추가
 sys.path.append('src')
@@ -15,31 +19,59 @@ sys.path.append('src')
 from claude_cli_agent import ClaudeCodeCLIAgent
 from agent_system import AgentConfig, AgentType
 
+logger = logging.getLogger(__name__)
+
+# 청크마다 전체 결과 dict를 repr해서 찍는 디버그 출력은 스트리밍 핫 루프를
+# 막으므로 TEST_VERBOSE가 설정된 경우에만 출력
+_VERBOSE = bool(os.environ.get("TEST_VERBOSE"))
+
+# claude --version 결과 캐시 — 재호출 시 CLI를 다시 스폰하지 않음
+_cached_version = None
+
+# 연속 대화에서 코드 문맥 참조 감지용 — 청크마다 content.lower() 사본을
+# 두 번 만드는 대신 대소문자 무시 정규식으로 제자리 스캔
+_CONTEXT_RE = re.compile(r'\b(def|function)\b', re.IGNORECASE)
+
+# 테스트 전역에서 같은 설정을 공유 (AgentConfig는 frozen이라 안전)
+_DEFAULT_CONFIG = AgentConfig(
+    agent_type=AgentType.CLAUDE_CODE,
+    executable_path="claude",  # 기본 경로
+    default_args=[],
+    timeout=300,
+    max_sessions=4  # 독립 서브테스트를 동시에 돌릴 수 있도록
+)
+
 async def test_claude_cli_availability():
     """Claude CLI 사용 가능 여부 확인"""
     print("=== Claude CLI 사용 가능성 테스트 ===")
     
     try:
-        config = AgentConfig(
-            agent_type=AgentType.CLAUDE_CODE,
-            executable_path="claude",  # 기본 경로
-            default_args=[],
-            timeout=300,
-            max_sessions=1
-        )
-        
-        agent = ClaudeCodeCLIAgent(config)
+        agent = ClaudeCodeCLIAgent(_DEFAULT_CONFIG)
         print(f"✅ Claude CLI 발견: {agent.claude_path}")
         
-        # 버전 확인
-        import subprocess
-        result = subprocess.run([agent.claude_path, '--version'], 
-                              capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            print(f"✅ Claude 버전: {result.stdout.strip()}")
-        else:
-            print(f"⚠️ 버전 확인 실패: {result.stderr}")
-        
+        # 버전 확인 — 블로킹 subprocess.run은 CLI 기동 내내 이벤트 루프를
+        # 막으므로 비동기로 스폰하고, 결과는 모듈 전역에 캐시
+        global _cached_version
+        if _cached_version is None:
+            proc = await asyncio.create_subprocess_exec(
+                agent.claude_path, '--version',
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                out, err = await asyncio.wait_for(proc.communicate(), timeout=10)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise
+            if proc.returncode == 0:
+                _cached_version = out.decode().strip()
+            else:
+                print(f"⚠️ 버전 확인 실패: {err.decode(errors='ignore')}")
+
+        if _cached_version:
+            print(f"✅ Claude 버전: {_cached_version}")
+
         return agent
         
     except FileNotFoundError:
@@ -53,69 +85,119 @@ async def test_claude_cli_availability():
 async def test_simple_command(agent: ClaudeCodeCLIAgent):
     """간단한 명령어 테스트"""
     print("\n=== 간단한 명령어 테스트 ===")
-    
+
     try:
-        # 세션 생성
+        # 동시 실행되는 테스트끼리 대화가 섞이지 않도록 세션은 테스트별로 생성
+        # (종료는 공유 에이전트의 with 블록이 일괄 처리)
         session_id = await agent.create_session("test_user", os.getcwd())
-        print(f"✅ 세션 생성: {session_id}")
-        
+
         # 간단한 질문
         test_message = "안녕하세요! 현재 시간을 알려주세요."
         print(f"📝 테스트 메시지: {test_message}")
         print("--- 응답 스트림 ---")
         
         response_count = 0
-        full_response = []
-        
-        async for result in agent.execute_command(session_id, test_message):
-            response_count += 1
-            timestamp = result.get('timestamp', datetime.now().isoformat())
-            result_type = result.get('type', 'unknown')
-            
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] #{response_count} - {result_type}")
-            
-            # 전체 결과 디버그 출력
-            print(f"  🔍 전체 결과: {result}")
-            
-            # 콘텐츠 출력
-            content = result.get('content', '')
-            if content:
-                full_response.append(content)
-                display_content = content[:150] + "..." if len(content) > 150 else content
-                print(f"  📄 콘텐츠: {display_content}")
-            
-            # 스트림 타입별 처리
-            stream_type = result.get('stream_type')
-            if stream_type:
-                print(f"  📡 스트림: {stream_type}")
-            
-            # 에러 확인
-            if 'error' in result:
-                error_type = result.get('error_type', 'unknown')
-                print(f"  ❌ 에러 ({error_type}): {result['error']}")
-                break
-            
-            # 완료 확인
-            if result_type == 'completion':
-                return_code = result.get('return_code', 0)
-                print(f"  ✅ 완료 (exit code: {return_code})")
-                break
-            
-            print("-" * 50)
-            
-            # 무한 루프 방지
-            if response_count > 20:
-                print("⚠️ 너무 많은 응답으로 인해 중단됩니다.")
-                break
-        
-        # 전체 응답 요약
-        if full_response:
-            print(f"\n📋 전체 응답 요약 ({len(full_response)}개 부분):")
-            full_text = "\n".join(full_response)
-            print(f"응답 길이: {len(full_text)} 문자")
-            print(f"첫 200자: {full_text[:200]}")
-            if len(full_text) > 200:
-                print(f"마지막 200자: ...{full_text[-200:]}")
+        # 전체 응답을 리스트로 모았다가 join하는 대신 요약에 필요한
+        # 길이/머리/꼬리만 유지 — 긴 스트림에서도 메모리가 O(1)
+        part_count = 0
+        total_len = 0
+        head = []           # 첫 200자 구성용
+        head_len = 0
+        tail = collections.deque(maxlen=200)  # 마지막 200자 (문자 단위 롤링)
+        t0 = time.monotonic()  # 청크마다 datetime.now()/strftime을 부르지 않음
+
+        # 줄마다 stdout flush(라인 버퍼 tty 기준 시스콜)를 일으키지 않도록
+        # 청크별 출력은 StringIO에 모았다가 10청크마다 한 번에 기록
+        buf = io.StringIO()
+
+        # 수신과 포매팅을 한 코루틴에 섞으면 포매팅하는 동안 CLI 파이프
+        # 읽기가 멈춰 출력이 밀린다. 유계 큐(64)를 사이에 두어 수신은
+        # 계속 진행하고, 소비가 밀리면 큐가 생산자에 역압을 건다.
+        queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+
+        async def producer():
+            try:
+                async for result in agent.execute_command(session_id, test_message):
+                    await queue.put(result)
+            finally:
+                await queue.put(None)
+
+        async def consumer():
+            nonlocal response_count, part_count, total_len, head_len
+
+            while (result := await queue.get()) is not None:
+                response_count += 1
+                result_type = result.get('type', 'unknown')
+
+                print(f"[+{time.monotonic() - t0:6.2f}s] #{response_count} - {result_type}", file=buf)
+
+                # 전체 결과 디버그 출력 (핫 루프의 dict repr은 verbose에서만)
+                if _VERBOSE:
+                    print(f"  🔍 전체 결과: {result}", file=buf)
+
+                # 콘텐츠 출력
+                content = result.get('content', '')
+                if content:
+                    part_count += 1
+                    total_len += len(content)
+                    if head_len < 200:
+                        head.append(content)
+                        head_len += len(content)
+                    tail.extend(content)
+                    # 150자 이하면 슬라이스/연결 할당 없이 원본 그대로 사용
+                    display_content = content if len(content) <= 150 else f"{content[:150]}..."
+                    print(f"  📄 콘텐츠: {display_content}", file=buf)
+
+                # 스트림 타입별 처리
+                stream_type = result.get('stream_type')
+                if stream_type:
+                    print(f"  📡 스트림: {stream_type}", file=buf)
+
+                # 에러 확인
+                if 'error' in result:
+                    error_type = result.get('error_type', 'unknown')
+                    print(f"  ❌ 에러 ({error_type}): {result['error']}", file=buf)
+                    break
+
+                # 완료 확인
+                if result_type == 'completion':
+                    return_code = result.get('return_code', 0)
+                    print(f"  ✅ 완료 (exit code: {return_code})", file=buf)
+                    break
+
+                print("-" * 50, file=buf)
+
+                # 10청크마다 모아둔 출력을 한 번에 기록
+                if response_count % 10 == 0:
+                    sys.stdout.write(buf.getvalue())
+                    buf.seek(0)
+                    buf.truncate()
+
+        async def _consume():
+            producer_task = asyncio.create_task(producer())
+            try:
+                await consumer()
+            finally:
+                producer_task.cancel()
+
+        # 응답 수 상한 대신 시간 상한 — 청크가 느리게 계속 흘러나와도
+        # 20청크를 다 기다리지 않고 제한 시간에 스트림을 바로 취소
+        try:
+            await asyncio.wait_for(_consume(), timeout=30)
+        except asyncio.TimeoutError:
+            print("⚠️ 30초 내에 완료되지 않아 스트림을 중단합니다.", file=buf)
+            await agent.terminate_session(session_id)
+
+        # 남은 출력 플러시
+        sys.stdout.write(buf.getvalue())
+
+        # 전체 응답 요약 (전체 텍스트를 다시 join하지 않고 요약만 출력)
+        if part_count:
+            print(f"\n📋 전체 응답 요약 ({part_count}개 부분):")
+            print(f"응답 길이: {total_len} 문자")
+            print(f"첫 200자: {''.join(head)[:200]}")
+            if total_len > 200:
+                print(f"마지막 200자: ...{''.join(tail)}")
         else:
             print("⚠️ 응답 콘텐츠가 없습니다.")
         
@@ -125,110 +207,117 @@ async def test_simple_command(agent: ClaudeCodeCLIAgent):
             print(f"세션 정보:")
             print(f"  - 대화 턴 수: {session_info.get('conversation_turns', 0)}")
             print(f"  - Claude 세션 ID: {session_info.get('claude_session_id', 'None')}")
-        
-        # 세션 종료
-        await agent.terminate_session(session_id)
-        print("✅ 세션 종료 완료")
-        
+
     except Exception as e:
         print(f"❌ 명령어 테스트 실패: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("테스트 실패 상세")
 
 async def test_continue_conversation(agent: ClaudeCodeCLIAgent):
     """대화 연속성 테스트 (--continue 옵션)"""
     print("\n=== 대화 연속성 테스트 ===")
-    
+
     try:
-        # 세션 생성
+        # 연속성 검증은 자기만의 세션이 있어야 의미가 있음
         session_id = await agent.create_session("test_user", os.getcwd())
-        print(f"✅ 세션 생성: {session_id}")
-        
+
         # 첫 번째 메시지
         first_message = "파이썬에서 'hello world'를 출력하는 코드를 작성해주세요."
         print(f"📝 첫 번째 메시지: {first_message}")
         
-        first_response = []
+        # 요약 출력에 필요한 길이와 첫 200자만 유지 (전체 join 제거)
+        first_head = []
+        first_head_len = 0
+        first_total = 0
         async for result in agent.execute_command(session_id, first_message):
-            print(f"  1️⃣ {result.get('type', 'unknown')}: {result}")
-            
+            if _VERBOSE:
+                print(f"  1️⃣ {result.get('type', 'unknown')}: {result}")
+
             content = result.get('content', '')
             if content:
-                first_response.append(content)
-                
+                first_total += len(content)
+                if first_head_len < 200:
+                    first_head.append(content)
+                    first_head_len += len(content)
+
             if result.get('type') == 'completion':
                 print("✅ 첫 번째 응답 완료")
                 break
             elif 'error' in result:
                 print(f"❌ 첫 번째 메시지 에러: {result['error']}")
                 return
-        
-        if first_response:
-            full_first = "\n".join(first_response)
-            print(f"📋 첫 번째 응답 ({len(full_first)} 문자): {full_first[:200]}...")
+
+        if first_total:
+            print(f"📋 첫 번째 응답 ({first_total} 문자): {''.join(first_head)[:200]}...")
         
         # 두 번째 메시지 (이전 대화 참조)
         second_message = "그 코드를 함수로 만들어주세요."
         print(f"📝 두 번째 메시지 (연속): {second_message}")
         
-        second_response = []
+        second_head = []
+        second_head_len = 0
+        second_total = 0
         context_found = False
-        
+
         async for result in agent.execute_command(session_id, second_message):
-            print(f"  2️⃣ {result.get('type', 'unknown')}: {result}")
-            
+            if _VERBOSE:
+                print(f"  2️⃣ {result.get('type', 'unknown')}: {result}")
+
             content = result.get('content', '')
             if content:
-                second_response.append(content)
-                if 'def' in content.lower() or 'function' in content.lower():
+                second_total += len(content)
+                if second_head_len < 200:
+                    second_head.append(content)
+                    second_head_len += len(content)
+                if not context_found and _CONTEXT_RE.search(content):
                     context_found = True
-                    
+
             if result.get('type') == 'completion':
                 print("✅ 두 번째 응답 완료")
                 break
             elif 'error' in result:
                 print(f"❌ 두 번째 메시지 에러: {result['error']}")
                 break
-        
-        if second_response:
-            full_second = "\n".join(second_response)
-            print(f"📋 두 번째 응답 ({len(full_second)} 문자): {full_second[:200]}...")
+
+        if second_total:
+            print(f"📋 두 번째 응답 ({second_total} 문자): {''.join(second_head)[:200]}...")
             
         if context_found:
             print("✅ 연속 대화 성공! 이전 컨텍스트를 참조했습니다.")
         else:
             print("⚠️ 연속 대화에서 이전 컨텍스트 참조를 확인할 수 없습니다.")
-        
-        # 세션 종료
-        await agent.terminate_session(session_id)
+
         print("✅ 연속성 테스트 완료")
         
     except Exception as e:
         print(f"❌ 연속성 테스트 실패: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("테스트 실패 상세")
 
 async def test_working_directory(agent: ClaudeCodeCLIAgent):
     """작업 디렉토리 테스트"""
     print("\n=== 작업 디렉토리 테스트 ===")
-    
+
     try:
-        # 현재 디렉토리에서 세션 생성
         session_id = await agent.create_session("test_user", os.getcwd())
         print(f"✅ 세션 생성 (작업 디렉토리: {os.getcwd()})")
-        
+
         # 현재 디렉토리 파일 목록 요청
         message = "현재 디렉토리의 파일 목록을 보여주세요."
         print(f"📝 테스트 메시지: {message}")
         
-        files_mentioned = []
+        # 디렉토리는 scandir로 한 번만 스냅샷(getdents64 한 번) — 청크마다
+        # listdir 시스콜을 반복하지 않고, 파일명 전체를 정규식 교대 패턴
+        # 하나로 묶어 청크당 한 번의 C 레벨 스캔으로 검사
+        # (긴 이름 우선이라 부분 이름에 가려지지 않음)
+        with os.scandir('.') as it:
+            files = [e.name for e in it if not e.name.startswith('.')]
+        pattern = re.compile("|".join(map(re.escape, sorted(files, key=len, reverse=True))))
+
+        files_mentioned = set()
         async for result in agent.execute_command(session_id, message):
             if result.get('type') == 'text':
                 content = result.get('content', '')
                 # 실제 존재하는 파일이 언급되는지 확인
-                for file in os.listdir('.'):
-                    if file in content:
-                        files_mentioned.append(file)
+                files_mentioned.update(pattern.findall(content))
             elif result.get('type') == 'completion':
                 break
             elif 'error' in result:
@@ -236,18 +325,15 @@ async def test_working_directory(agent: ClaudeCodeCLIAgent):
                 break
         
         if files_mentioned:
-            print(f"✅ 작업 디렉토리 인식 성공! 언급된 파일들: {files_mentioned[:3]}")
+            print(f"✅ 작업 디렉토리 인식 성공! 언급된 파일들: {sorted(files_mentioned)[:3]}")
         else:
             print("⚠️ 작업 디렉토리를 정확히 인식하지 못했을 수 있습니다.")
-        
-        # 세션 종료
-        await agent.terminate_session(session_id)
+
         print("✅ 작업 디렉토리 테스트 완료")
         
     except Exception as e:
         print(f"❌ 작업 디렉토리 테스트 실패: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("테스트 실패 상세")
 
 async def test_error_handling(agent: ClaudeCodeCLIAgent):
     """에러 처리 테스트"""
@@ -282,8 +368,7 @@ async def test_error_handling(agent: ClaudeCodeCLIAgent):
         
     except Exception as e:
         print(f"❌ 에러 처리 테스트 실패: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("테스트 실패 상세")
 
 async def main():
     """메인 테스트 함수"""
@@ -296,23 +381,35 @@ async def main():
         print("\n❌ Claude CLI를 사용할 수 없어 테스트를 중단합니다.")
         print("다음 명령어로 설치하세요: npm install -g @anthropic-ai/claude-code")
         return
-    
-    # 기본 명령어 테스트
-    await test_simple_command(agent)
-    
-    # 대화 연속성 테스트
-    await test_continue_conversation(agent)
-    
-    # 작업 디렉토리 테스트
-    await test_working_directory(agent)
-    
-    # 에러 처리 테스트
-    await test_error_handling(agent)
-    
+
+    # 에이전트는 하나를 재사용하고, 독립 서브테스트는 동시에 실행 —
+    # 각 테스트가 Claude CLI 지연(초 단위)에 묶여 있어 총 소요 시간이
+    # 합계가 아니라 최대치로 줄어든다. 세션은 테스트별로 분리.
+    async with agent:
+        results = await asyncio.gather(
+            test_simple_command(agent),
+            test_continue_conversation(agent),
+            test_working_directory(agent),
+            test_error_handling(agent),
+            return_exceptions=True
+        )
+
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"❌ 서브테스트 예외: {result}")
+
     print("\n🎉 모든 테스트 완료!")
     print("\nℹ️ 참고사항:")
     print("   - Claude CLI가 정상적으로 작동하려면 Anthropic API 키가 설정되어야 합니다")
     print("   - 일부 테스트는 네트워크 연결과 API 사용량에 따라 결과가 달라질 수 있습니다")
 
 if __name__ == "__main__":
+    # uvloop이 설치되어 있으면 기본 이벤트 루프로 사용 (Windows 미지원)
+    try:
+        if sys.platform != "win32":
+            import uvloop
+            uvloop.install()
+    except ImportError:
+        pass
+
     asyncio.run(main())
\ No newline at end of file
@@ -5,47 +5,49 @@
 """
 
 import asyncio
+import io
+import logging
+import shutil
 import sys
 import os
 import json
-from datetime import datetime
+import time
 
 # 프로젝트 경로 추가
 sys.path.append('src')
 
-from claude_code_sdk_agent import ClaudeCodeSDKAgent
+from claude_code_sdk_agent import ClaudeCodeSDKAgent, SDK_AVAILABLE
 from agent_system import AgentConfig, AgentType
+from tests._common import assert_invalid_inputs_raise
 
-async def test_claude_sdk_agent():
+logger = logging.getLogger(__name__)
+
+# CLI 유무는 모듈 로드 시 PATH 조회 한 번으로 확인 — 미설치 환경에서
+# CLI를 스폰해 실패를 기다리는 통합 테스트를 아예 건너뛴다
+CLI_AVAILABLE = shutil.which("claude") is not None
+
+# 테스트 전역에서 같은 설정을 공유 (AgentConfig는 frozen이라 안전)
+_DEFAULT_CONFIG = AgentConfig(
+    agent_type=AgentType.CLAUDE_CODE,
+    executable_path="claude-code-sdk",  # SDK에서는 사용되지 않음
+    default_args=[],
+    timeout=300,
+    max_sessions=1,
+    stream_format='sdk'
+)
+
+async def test_claude_sdk_agent(agent: ClaudeCodeSDKAgent, session_id: str):
     """공식 Claude SDK 에이전트 통합 테스트"""
     print("=== Claude Code SDK Agent 통합 테스트 ===")
-    
+
     try:
-        # 에이전트 설정
-        config = AgentConfig(
-            agent_type=AgentType.CLAUDE_CODE,
-            executable_path="claude-code-sdk",  # SDK에서는 사용되지 않음
-            default_args=[],
-            timeout=300,
-            max_sessions=1,
-            stream_format='sdk'
-        )
-        
-        # 에이전트 생성
-        agent = ClaudeCodeSDKAgent(config)
-        print("✅ Claude SDK Agent 생성 성공")
-        
         # SDK 옵션 확인
         print(f"SDK 옵션:")
         print(f"  - Max turns: {agent.sdk_options.max_turns}")
         print(f"  - Permission mode: {agent.sdk_options.permission_mode}")
         print(f"  - Allowed tools: {', '.join(agent.sdk_options.allowed_tools)}")
         print(f"  - System prompt: {agent.sdk_options.system_prompt[:50]}...")
-        
-        # 테스트 세션 생성
-        session_id = await agent.create_session("test_user", os.getcwd())
-        print(f"✅ 세션 생성 성공: {session_id}")
-        
+
         # 세션 정보 확인
         session_info = await agent.get_session_info(session_id)
         if session_info:
@@ -58,138 +60,174 @@ async def test_claude_sdk_agent():
         
         # 명령 실행 및 결과 출력
         response_count = 0
-        async for result in agent.execute_command(session_id, test_message):
-            response_count += 1
-            timestamp = result.get('timestamp', datetime.now().isoformat())
-            result_type = result.get('type', 'unknown')
-            
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] #{response_count} - {result_type}")
-            
-            # 콘텐츠 출력
-            content = result.get('content', '')
-            if content:
-                display_content = content[:150] + "..." if len(content) > 150 else content
-                print(f"  콘텐츠: {display_content}")
-            
-            # 에러 처리
-            if 'error' in result:
-                error_type = result.get('error_type', 'unknown')
-                print(f"  ❌ 에러 ({error_type}): {result['error']}")
-                
-                # CLI 미설치 에러인 경우 설치 안내
-                if error_type == 'cli_not_found':
-                    print("  ℹ️ 해결방법: npm install -g @anthropic-ai/claude-code")
+        t0 = time.monotonic()  # 청크마다 datetime.now()/strftime을 부르지 않음
+
+        # 줄마다 stdout flush를 일으키지 않도록 청크별 출력은 StringIO에
+        # 모았다가 10청크마다 한 번에 기록
+        buf = io.StringIO()
+
+        async def _consume():
+            nonlocal response_count
+
+            async for result in agent.execute_command(session_id, test_message):
+                response_count += 1
+                result_type = result.get('type', 'unknown')
+
+                print(f"[+{time.monotonic() - t0:6.2f}s] #{response_count} - {result_type}", file=buf)
+
+                # 콘텐츠 출력
+                content = result.get('content', '')
+                if content:
+                    # 150자 이하면 슬라이스/연결 할당 없이 원본 그대로 사용
+                    display_content = content if len(content) <= 150 else f"{content[:150]}..."
+                    print(f"  콘텐츠: {display_content}", file=buf)
+
+                # 에러 처리
+                if 'error' in result:
+                    error_type = result.get('error_type', 'unknown')
+                    print(f"  ❌ 에러 ({error_type}): {result['error']}", file=buf)
+
+                    # CLI 미설치 에러인 경우 설치 안내
+                    if error_type == 'cli_not_found':
+                        print("  ℹ️ 해결방법: npm install -g @anthropic-ai/claude-code", file=buf)
+                        break
+
+                # AssistantMessage 상세 정보
+                if result_type == 'assistant_message':
+                    print(f"  블록 수: {result.get('block_count', 0)}", file=buf)
+                    if result.get('tool_uses'):
+                        print(f"  도구 사용: {len(result['tool_uses'])}개", file=buf)
+
+                # 완료 메시지인 경우 루프 종료
+                if result_type == 'completion':
+                    print(f"  수신 메시지 수: {result.get('message_count', 0)}", file=buf)
                     break
-            
-            # AssistantMessage 상세 정보
-            if result_type == 'assistant_message':
-                print(f"  블록 수: {result.get('block_count', 0)}")
-                if result.get('tool_uses'):
-                    print(f"  도구 사용: {len(result['tool_uses'])}개")
-            
-            # 완료 메시지인 경우 루프 종료
-            if result_type == 'completion':
-                print(f"  수신 메시지 수: {result.get('message_count', 0)}")
-                break
-            
-            print("-" * 50)
-            
-            # 무한 루프 방지
-            if response_count > 10:
-                print("⚠️ 너무 많은 응답으로 인해 중단됩니다.")
-                break
-        
-        # 세션 정리
-        await agent.terminate_session(session_id)
-        print("✅ 세션 종료 완료")
-        
+
+                print("-" * 50, file=buf)
+
+                # 10청크마다 모아둔 출력을 한 번에 기록
+                if response_count % 10 == 0:
+                    sys.stdout.write(buf.getvalue())
+                    buf.seek(0)
+                    buf.truncate()
+
+        # 응답 수 상한 대신 시간 상한 — 스트림이 멈춰도 제한 시간에 바로 취소
+        try:
+            await asyncio.wait_for(_consume(), timeout=30)
+        except asyncio.TimeoutError:
+            print("⚠️ 30초 내에 완료되지 않아 스트림을 중단합니다.", file=buf)
+            await agent.terminate_session(session_id)
+
+        # 남은 출력 플러시
+        sys.stdout.write(buf.getvalue())
+
     except Exception as e:
         print(f"❌ 테스트 실패: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("테스트 실패 상세")
+
+# 파싱 테스트용 목 메시지 캐시 (SDK import 성공 시 한 번만 구성)
+_sdk_test_cases = None
+
+class _UnknownMessage:
+    """핸들러 테이블에 없는 메시지 타입 (unknown 폴백 경로 검증용)"""
 
-async def test_sdk_message_parsing():
+    def __str__(self):
+        return '알 수 없는 메시지 타입'
+
+def _build_sdk_test_cases():
+    """SDK 메시지 파싱용 고정 메시지를 한 번만 구성해 재사용
+
+    parse_sdk_message는 type(message)로 핸들러를 조회하므로 spec을 준
+    MagicMock(타입이 MagicMock)은 전부 unknown 폴백으로 빠진다 —
+    반드시 실제 SDK 타입 인스턴스를 사용해야 디스패치가 검증된다.
+    각 케이스의 expect는 파싱 결과 검증(assert)에 쓰인다.
+    """
+    global _sdk_test_cases
+    if _sdk_test_cases is not None:
+        return _sdk_test_cases
+
+    from claude_code_sdk import AssistantMessage, TextBlock, ToolUseBlock
+
+    assistant = AssistantMessage(
+        content=[TextBlock(text='안녕하세요! 도움이 필요한 일이 있나요?')]
+    )
+
+    assistant_with_tool = AssistantMessage(
+        content=[
+            TextBlock(text='파일을 읽어보겠습니다.'),
+            ToolUseBlock(id='tool_123', name='Read', input={'file_path': '/test/file.txt'}),
+        ]
+    )
+
+    _sdk_test_cases = [
+        {
+            "name": "AssistantMessage with TextBlock",
+            "message": assistant,
+            "expect": {
+                "type": "assistant_message",
+                "content": '안녕하세요! 도움이 필요한 일이 있나요?',
+                "tool_uses": 0,
+                "block_count": 1,
+            },
+        },
+        {
+            "name": "AssistantMessage with ToolUse",
+            "message": assistant_with_tool,
+            "expect": {
+                "type": "assistant_message",
+                "content": '파일을 읽어보겠습니다.',
+                "tool_uses": 1,
+                "block_count": 2,
+            },
+        },
+        {
+            "name": "Unknown Message Type",
+            "message": _UnknownMessage(),
+            "expect": {
+                "type": "unknown__unknownmessage",
+                "content": '알 수 없는 메시지 타입',
+            },
+        },
+    ]
+    return _sdk_test_cases
+
+async def test_sdk_message_parsing(agent: ClaudeCodeSDKAgent):
     """공식 SDK 메시지 파싱 테스트 (실제 SDK 타입들 사용)"""
     print("\n=== SDK 메시지 파싱 테스트 ===")
-    
+
     try:
-        # SDK가 사용 가능한지 먼저 확인
-        from claude_code_sdk import AssistantMessage, TextBlock, ToolUseBlock
-        
-        config = AgentConfig(
-            agent_type=AgentType.CLAUDE_CODE,
-            executable_path="claude-code-sdk",
-            default_args=[],
-            timeout=300,
-            max_sessions=1
-        )
-        
-        agent = ClaudeCodeSDKAgent(config)
-        
-        # 실제 SDK 타입들로 테스트 메시지 생성
-        test_cases = [
-            {
-                "name": "AssistantMessage with TextBlock",
-                "message": type('AssistantMessage', (), {
-                    '__class__': AssistantMessage,
-                    'content': [type('TextBlock', (), {
-                        '__class__': TextBlock,
-                        'text': '안녕하세요! 도움이 필요한 일이 있나요?'
-                    })()]
-                })()
-            },
-            {
-                "name": "AssistantMessage with ToolUse",
-                "message": type('AssistantMessage', (), {
-                    '__class__': AssistantMessage,
-                    'content': [
-                        type('TextBlock', (), {
-                            '__class__': TextBlock,
-                            'text': '파일을 읽어보겠습니다.'
-                        })(),
-                        type('ToolUseBlock', (), {
-                            '__class__': ToolUseBlock,
-                            'id': 'tool_123',
-                            'name': 'Read',
-                            'input': {'file_path': '/test/file.txt'}
-                        })()
-                    ]
-                })()
-            },
-            {
-                "name": "Unknown Message Type",
-                "message": type('UnknownMessage', (), {
-                    '__str__': lambda self: '알 수 없는 메시지 타입'
-                })()
-            }
-        ]
-        
+        # SDK가 사용 가능한지 먼저 확인 (목 메시지는 한 번만 생성)
+        test_cases = _build_sdk_test_cases()
+
         for i, test_case in enumerate(test_cases, 1):
             print(f"\n테스트 {i}: {test_case['name']}")
-            try:
-                result = await agent.parse_sdk_message(test_case['message'])
-                print(f"✅ 파싱 성공")
-                print(f"   타입: {result['type']}")
-                print(f"   콘텐츠: {result['content'][:50]}..." if len(result.get('content', '')) > 50 else f"   콘텐츠: {result.get('content', '')}")
-                
-                # AssistantMessage의 경우 더 상세한 정보 출력
-                if result['type'] == 'assistant_message':
-                    print(f"   텍스트 블록 수: {len(result.get('text_blocks', []))}")
-                    print(f"   도구 사용 수: {len(result.get('tool_uses', []))}")
-                    print(f"   전체 블록 수: {result.get('block_count', 0)}")
-                
-            except Exception as e:
-                print(f"❌ 파싱 실패: {e}")
-                import traceback
-                traceback.print_exc()
-    
+            result = await agent.parse_sdk_message(test_case['message'])
+            print(f"✅ 파싱 성공")
+            print(f"   타입: {result['type']}")
+            print(f"   콘텐츠: {result['content'][:50]}..." if len(result.get('content', '')) > 50 else f"   콘텐츠: {result.get('content', '')}")
+
+            # AssistantMessage의 경우 더 상세한 정보 출력
+            if result['type'] == 'assistant_message':
+                print(f"   텍스트 블록 수: {len(result.get('text_blocks', []))}")
+                print(f"   도구 사용 수: {len(result.get('tool_uses', []))}")
+                print(f"   전체 블록 수: {result.get('block_count', 0)}")
+
+            # 파싱 결과 검증 — 디스패치가 깨지면 (예: unknown 폴백으로
+            # 빠지면) 출력만 바뀌는 게 아니라 테스트가 실패해야 한다
+            expect = test_case['expect']
+            assert result['type'] == expect['type'], \
+                f"타입 불일치: {result['type']!r} != {expect['type']!r}"
+            assert result['content'] == expect['content'], \
+                f"콘텐츠 불일치: {result['content']!r}"
+            if 'tool_uses' in expect:
+                assert len(result['tool_uses']) == expect['tool_uses'], \
+                    f"도구 사용 수 불일치: {len(result['tool_uses'])}"
+                assert result['block_count'] == expect['block_count'], \
+                    f"블록 수 불일치: {result['block_count']}"
+
     except ImportError as e:
         print(f"❌ SDK import 실패: {e}")
         print("실제 SDK가 설치되지 않았으므로 파싱 테스트를 건너뜁니다.")
-    except Exception as e:
-        print(f"❌ 파싱 테스트 실패: {e}")
-        import traceback
-        traceback.print_exc()
 
 async def test_sdk_availability():
     """공식 Claude Code SDK 사용 가능 여부 및 버전 확인"""
@@ -240,24 +278,13 @@ async def test_sdk_availability():
         print("참고: Claude Code CLI도 설치되어야 함 (npm install -g @anthropic-ai/claude-code)")
     except Exception as e:
         print(f"❌ SDK 테스트 실패: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("테스트 실패 상세")
 
-async def test_error_handling():
+async def test_error_handling(agent: ClaudeCodeSDKAgent):
     """에러 처리 시나리오 테스트"""
     print("\n=== 에러 처리 테스트 ===")
-    
+
     try:
-        config = AgentConfig(
-            agent_type=AgentType.CLAUDE_CODE,
-            executable_path="claude-code-sdk",
-            default_args=[],
-            timeout=300,
-            max_sessions=1
-        )
-        
-        agent = ClaudeCodeSDKAgent(config)
-        
         # 잘못된 메시지 타입 파싱 테스트
         print("잘못된 메시지 타입 파싱 테스트:")
         
@@ -268,21 +295,14 @@ async def test_error_handling():
             "plain string",
             []
         ]
-        
-        for i, invalid_msg in enumerate(invalid_messages, 1):
-            print(f"\n테스트 {i}: {type(invalid_msg)} - {invalid_msg}")
-            try:
-                result = await agent.parse_sdk_message(invalid_msg)
-                print(f"✅ 파싱 완료 (타입: {result['type']})")
-            except Exception as e:
-                print(f"❌ 파싱 에러: {e}")
-        
+
+        await assert_invalid_inputs_raise(agent, invalid_messages)
+
         print("\n✅ 에러 처리 테스트 완료")
         
     except Exception as e:
         print(f"❌ 에러 처리 테스트 실패: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("테스트 실패 상세")
 
 async def main():
     """메인 테스트 함수"""
@@ -290,16 +310,33 @@ async def main():
     
     # SDK 사용 가능 여부 확인
     await test_sdk_availability()
-    
-    # 메시지 파싱 테스트
-    await test_sdk_message_parsing()
-    
-    # 에러 처리 테스트
-    await test_error_handling()
-    
-    # 실제 에이전트 테스트
-    await test_claude_sdk_agent()
-    
+
+    # SDK 미설치 환경에서는 에이전트 생성 자체가 ImportError라 여기서 중단
+    if not SDK_AVAILABLE:
+        print("\n⚠️ claude-code-sdk 미설치 — 에이전트 테스트를 건너뜁니다.")
+        print("   설치: pip install claude-code-sdk")
+        return
+
+    # 에이전트와 세션을 테스트마다 만들지 않고 하나를 재사용 —
+    # 테스트당 SDK 핸드셰이크 비용이 사라지고 with 종료 시 일괄 정리됨
+    async with ClaudeCodeSDKAgent(_DEFAULT_CONFIG) as agent:
+        print("✅ Claude SDK Agent 생성 성공")
+
+        # 메시지 파싱 테스트
+        await test_sdk_message_parsing(agent)
+
+        # 에러 처리 테스트
+        await test_error_handling(agent)
+
+        # 실제 에이전트 테스트 (공유 세션 사용, CLI가 있을 때만)
+        if CLI_AVAILABLE:
+            session_id = await agent.create_session("test_user", os.getcwd())
+            print(f"✅ 세션 생성 성공: {session_id}")
+            await test_claude_sdk_agent(agent, session_id)
+        else:
+            print("⚠️ claude CLI 미설치 — 통합 테스트를 건너뜁니다.")
+            print("   설치: npm install -g @anthropic-ai/claude-code")
+
     print("\n🎉 모든 테스트 완료!")
     print("ℹ️ 실제 Claude SDK 사용을 위해서는 다음이 필요합니다:")
     print("   1. Claude Code CLI 설치: npm install -g @anthropic-ai/claude-code")
@@ -307,4 +344,12 @@ async def main():
     print("   3. 적절한 환경 변수 설정")
 
 if __name__ == "__main__":
+    # uvloop이 설치되어 있으면 기본 이벤트 루프로 사용 (Windows 미지원)
+    try:
+        if sys.platform != "win32":
+            import uvloop
+            uvloop.install()
+    except ImportError:
+        pass
+
     asyncio.run(main())
\ No newline at end of file
@@ -9,19 +9,47 @@ Agent Server와 통신하는 테스트용 웹 인터페이스
 
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import orjson
 import re
 import time
 import asyncio
+import atexit
+import threading
 import aiohttp
 from typing import Dict, Optional, AsyncGenerator
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+@st.cache_resource(show_spinner=False)
+def _config() -> Dict[str, str]:
+    """환경 설정 로드 (rerun마다 .env 파일을 다시 읽지 않도록 1회만 실행)"""
+    load_dotenv()
+    return {"AGENT_SERVER_URL": f"http://localhost:{os.getenv('EXECUTOR_PORT', 8001)}"}
 
 # 설정
-AGENT_SERVER_URL = f"http://localhost:{os.getenv('EXECUTOR_PORT', 8001)}"
+AGENT_SERVER_URL = _config()["AGENT_SERVER_URL"]
+
+# ANSI 이스케이프 시퀀스 제거용 (매 호출마다 컴파일하지 않도록 모듈 레벨에 정의)
+_ANSI_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+
+def strip_ansi_codes(text: str) -> str:
+    """터미널 출력에서 ANSI 제어 코드를 제거"""
+    return _ANSI_RE.sub('', text)
+
+# SSE 데이터 라인 접두사 (바이트 루프 공용)
+_DATA_PREFIX = b'data: '
+_DATA_PREFIX_LEN = len(_DATA_PREFIX)
+
+# 빠른 명령 (버튼 라벨, 프롬프트) — rerun마다 리터럴을 재구성하지 않도록 상수로
+_QUICK_CMDS = (
+    ("📁 파일 목록", "현재 디렉토리의 파일과 폴더를 보여주세요"),
+    ("📊 시스템 정보", "시스템 정보를 알려주세요"),
+    ("💾 Git 상태", "git status를 확인해주세요"),
+    ("🐍 Python 버전", "Python 버전을 확인해주세요"),
+)
 
 # Streamlit 페이지 설정
 st.set_page_config(
@@ -31,8 +59,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# CSS 스타일
-st.markdown("""
+# CSS 스타일 (모듈 상수 — 내용이 같으면 프런트엔드가 캐시된 렌더링을 재사용)
+_CSS = """
 <style>
 .main-header {
     font-size: 2rem;
@@ -62,7 +90,10 @@ st.markdown("""
     color: #0c5460;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# rerun마다 다시 내보내야 함: 해당 실행에서 생성되지 않은 요소는 화면에서 제거됨
+st.markdown(_CSS, unsafe_allow_html=True)
 
 # 세션 상태 초기화
 if 'session_id' not in st.session_state:
@@ -70,21 +101,49 @@ if 'session_id' not in st.session_state:
 if 'agent_type' not in st.session_state:
     st.session_state.agent_type = None
 if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+    # 컬럼 단위(SoA) 저장: 긴 대화에서 rerun마다 튜플 언패킹 없이 순회
+    st.session_state.chat_history = {"user": [], "agent": []}
 if 'available_agents' not in st.session_state:
     st.session_state.available_agents = []
 if 'input_key' not in st.session_state:
     st.session_state.input_key = 0
 
+@st.cache_resource(show_spinner=False)
+def _http_session() -> requests.Session:
+    """모든 동기 HTTP 호출이 공유하는 세션 (keep-alive 커넥션 풀 재사용)
+
+    재시도는 서버 재기동 시 흔한 502/503/504에 한정하고, 풀 크기는
+    AGENT_HTTP_POOL 환경 변수로 조정할 수 있다.
+    """
+    pool_size = int(os.getenv('AGENT_HTTP_POOL', 32))
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST", "DELETE"]),
+        ),
+    )
+    session.mount("http://", adapter)
+    return session
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_agents_cached(url: str) -> Dict:
+    """에이전트 목록 HTTP 호출 (rerun마다 재요청하지 않도록 30초 캐시)"""
+    response = _http_session().get(f"{url}/agents", timeout=5)
+    response.raise_for_status()
+    return response.json()
+
 def get_available_agents() -> Optional[Dict]:
     """사용 가능한 에이전트 목록 조회"""
     try:
-        response = requests.get(f"{AGENT_SERVER_URL}/agents", timeout=5)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"에이전트 목록 조회 실패: HTTP {response.status_code}")
-            return None
+        return _fetch_agents_cached(AGENT_SERVER_URL)
+    except requests.exceptions.HTTPError as e:
+        st.error(f"에이전트 목록 조회 실패: HTTP {e.response.status_code}")
+        return None
     except requests.exceptions.RequestException as e:
         st.error(f"서버 연결 실패: {e}")
         return None
@@ -98,7 +157,7 @@ def create_session(agent_type: str, working_directory: str = None) -> Optional[s
             "working_directory": working_directory
         }
         
-        response = requests.post(f"{AGENT_SERVER_URL}/sessions", json=data, timeout=30)
+        response = _http_session().post(f"{AGENT_SERVER_URL}/sessions", json=data, timeout=30)
         if response.status_code == 200:
             result = response.json()
             return result["session_id"]
@@ -109,14 +168,18 @@ def create_session(agent_type: str, working_directory: str = None) -> Optional[s
         st.error(f"세션 생성 중 오류: {e}")
         return None
 
+@st.cache_data(ttl=2, show_spinner=False)
+def _fetch_session_info_cached(url: str, session_id: str) -> Optional[Dict]:
+    """세션 정보 HTTP 호출 (연속 rerun 동안 2초 캐시)"""
+    response = _http_session().get(f"{url}/sessions/{session_id}", timeout=5)
+    if response.status_code == 200:
+        return response.json()
+    return None
+
 def get_session_info(session_id: str) -> Optional[Dict]:
     """세션 정보 조회"""
     try:
-        response = requests.get(f"{AGENT_SERVER_URL}/sessions/{session_id}", timeout=5)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return None
+        return _fetch_session_info_cached(AGENT_SERVER_URL, session_id)
     except requests.exceptions.RequestException as e:
         st.error(f"세션 정보 조회 실패: {e}")
         return None
@@ -124,75 +187,176 @@ def get_session_info(session_id: str) -> Optional[Dict]:
 def terminate_session(session_id: str) -> bool:
     """세션 종료"""
     try:
-        response = requests.delete(f"{AGENT_SERVER_URL}/sessions/{session_id}", timeout=5)
+        response = _http_session().delete(f"{AGENT_SERVER_URL}/sessions/{session_id}", timeout=5)
         return response.status_code == 200
     except requests.exceptions.RequestException as e:
         st.error(f"세션 종료 실패: {e}")
         return False
 
+@st.cache_resource(show_spinner=False)
+def _async_runtime():
+    """백그라운드 이벤트 루프와 공유 aiohttp 세션.
+
+    asyncio.run()은 호출마다 새 루프를 만들어 keep-alive 커넥션을 버리므로,
+    전용 루프를 데몬 스레드에서 돌리고 그 위에 세션을 한 번만 생성한다.
+    비동기 호출은 run_coroutine_threadsafe로 이 루프에 제출한다.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    async def _make_session():
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, limit_per_host=16, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=300),
+        )
+
+    session = asyncio.run_coroutine_threadsafe(_make_session(), loop).result()
+    atexit.register(
+        lambda: asyncio.run_coroutine_threadsafe(session.close(), loop).result(5)
+    )
+    return loop, session
+
 async def execute_command_async(session_id: str, message: str) -> AsyncGenerator[str, None]:
-    """비동기 명령 실행 및 스트리밍"""
+    """비동기 명령 실행 및 스트리밍 (_async_runtime의 루프 위에서 실행해야 함)"""
     try:
-        async with aiohttp.ClientSession() as session:
-            data = {
-                "session_id": session_id,
-                "message": message
-            }
-            
-            async with session.post(f"{AGENT_SERVER_URL}/execute", json=data) as resp:
-                if resp.status == 200:
-                    async for line in resp.content:
-                        line_str = line.decode('utf-8').strip()
-                        if line_str.startswith('data: '):
-                            yield line_str[6:]  # 'data: ' 제거
-                else:
-                    yield json.dumps({"error": f"HTTP {resp.status}"})
+        _, session = _async_runtime()
+        data = {
+            "session_id": session_id,
+            "message": message
+        }
+
+        async with session.post(f"{AGENT_SERVER_URL}/execute", json=data) as resp:
+            if resp.status == 200:
+                # 큰 청크로 읽고 줄 분리는 bytearray에서 직접 수행
+                raw = bytearray()
+                async for chunk in resp.content.iter_chunked(65536):
+                    raw += chunk
+                    idx = raw.rfind(b'\n')
+                    if idx < 0:
+                        continue
+                    lines = bytes(raw[:idx]).split(b'\n')
+                    del raw[:idx + 1]
+                    for line in lines:
+                        if line.startswith(_DATA_PREFIX):
+                            yield line[_DATA_PREFIX_LEN:].decode('utf-8')  # 'data: ' 제거
+            else:
+                yield json.dumps({"error": f"HTTP {resp.status}"})
     except Exception as e:
         yield json.dumps({"error": str(e)})
 
-def execute_command_sync(session_id: str, message: str) -> str:
-    """동기 명령 실행 (간단한 테스트용)"""
+async def _collect_response(session_id: str, message: str) -> str:
+    """SSE 스트림을 끝까지 소비해 표시용 문자열 하나로 합침"""
+    parts = []
+    append = parts.append
+    async for payload in execute_command_async(session_id, message):
+        try:
+            data_obj = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            cleaned = strip_ansi_codes(payload)
+            if cleaned.strip():
+                append(f"[RAW] {cleaned}")
+            continue
+
+        if "error" in data_obj:
+            return f"❌ 오류: {data_obj['error']}"
+
+        content = data_obj.get("content", "")
+        if content:
+            cleaned = strip_ansi_codes(content)
+            if cleaned.strip():
+                append(cleaned)
+
+    return "\n".join(parts) if parts else "✅ 실행 완료 (출력 없음)"
+
+def dispatch_commands(session_id: str, messages) -> list:
+    """여러 명령을 공유 루프에 한 번에 제출하고 응답 목록을 돌려줌
+
+    버튼마다 blocking 호출 + rerun을 반복하는 대신, 같은 rerun에서 모인
+    명령들을 asyncio.gather로 동시에 실행한다.
+    """
+    loop, _ = _async_runtime()
+
+    async def _batch():
+        return await asyncio.gather(
+            *(_collect_response(session_id, m) for m in messages)
+        )
+
+    return asyncio.run_coroutine_threadsafe(_batch(), loop).result()
+
+def execute_command_stream(session_id: str, message: str):
+    """명령 실행 결과를 SSE 청크 단위로 yield (st.write_stream용)
+
+    전체 응답을 모아 한 번에 돌려주는 대신 파싱되는 대로 내보내
+    첫 출력까지의 체감 지연을 줄인다.
+    """
     try:
         data = {
             "session_id": session_id,
             "message": message
         }
-        
-        response = requests.post(f"{AGENT_SERVER_URL}/execute", json=data, timeout=30, stream=True)
-        
-        def strip_ansi_codes(text):
-            ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-            return ansi_escape.sub('', text)
 
-        if response.status_code == 200:
-            output_parts = []
-            for line in response.iter_lines(decode_unicode=True):
-                if line.startswith('data: '):
-                    try:
-                        data_str = line[6:]
-                        data_obj = json.loads(data_str)
-                        
-                        if "error" in data_obj:
-                            return f"❌ 오류: {data_obj['error']}"
-                        
-                        content = data_obj.get("content", "")
-                        if content:
-                            # ANSI 코드 제거 후 추가
-                            cleaned_content = strip_ansi_codes(str(content))
-                            if cleaned_content.strip():
-                                output_parts.append(cleaned_content)
-
-                    except json.JSONDecodeError:
-                        # JSON 파싱 실패 시 원본 데이터 추가 (디버깅용)
-                        cleaned_line = strip_ansi_codes(line)
-                        if cleaned_line.strip():
-                            output_parts.append(f"[RAW] {cleaned_line}")
-            
-            return "\n".join(output_parts) if output_parts else "✅ 실행 완료 (출력 없음)"
-        else:
-            return f"❌ HTTP {response.status_code} 오류: {response.text}"
+        response = _http_session().post(f"{AGENT_SERVER_URL}/execute", json=data, timeout=30, stream=True)
+
+        if response.status_code != 200:
+            yield f"❌ HTTP {response.status_code} 오류: {response.text}"
+            return
+
+        # 라인마다 yield하면 DOM 패치가 그만큼 발생하므로
+        # 약 한 프레임(16ms) 또는 2KB 단위로 모아서 내보냄
+        buf = []
+        buf_len = 0
+        t0 = time.monotonic()
+
+        # iter_lines 대신 큰 청크로 읽고 줄 분리는 bytearray에서 직접 수행
+        # (라인당 파이썬 오버헤드 절감, JSON 페이로드만 디코딩)
+        raw = bytearray()
+        for chunk in response.iter_content(chunk_size=65536):
+            raw += chunk
+            idx = raw.rfind(b'\n')
+            if idx < 0:
+                continue
+            lines = bytes(raw[:idx]).split(b'\n')
+            del raw[:idx + 1]
+
+            for line in lines:
+                if not line.startswith(_DATA_PREFIX):
+                    continue
+                try:
+                    # bytes 페이로드를 그대로 C 구현 파서에 전달
+                    data_obj = orjson.loads(line[_DATA_PREFIX_LEN:])
+                except orjson.JSONDecodeError:
+                    # JSON 파싱 실패 시 원본 데이터 표시 (디버깅용)
+                    cleaned_line = strip_ansi_codes(line.decode('utf-8', 'replace'))
+                    if cleaned_line.strip():
+                        buf.append(f"[RAW] {cleaned_line}\n")
+                        buf_len += len(cleaned_line)
+                else:
+                    if "error" in data_obj:
+                        if buf:
+                            yield "".join(buf)
+                        yield f"❌ 오류: {data_obj['error']}"
+                        return
+
+                    content = data_obj.get("content", "")
+                    if content:
+                        # ANSI 코드 제거 후 전달
+                        cleaned_content = strip_ansi_codes(content)
+                        if cleaned_content.strip():
+                            buf.append(cleaned_content + "\n")
+                            buf_len += len(cleaned_content)
+
+            if buf:
+                now = time.monotonic()
+                if buf_len > 2048 or now - t0 > 0.016:
+                    yield "".join(buf)
+                    buf.clear()
+                    buf_len = 0
+                    t0 = now
+
+        if buf:
+            yield "".join(buf)
     except requests.exceptions.RequestException as e:
-        return f"❌ 요청 실패: {e}"
+        yield f"❌ 요청 실패: {e}"
 
 # 메인 UI
 st.markdown('<div class="main-header">🤖 Remote Agent Test UI</div>', unsafe_allow_html=True)
@@ -204,6 +368,8 @@ with st.sidebar:
     # 서버 상태 확인
     with st.expander("📊 서버 상태", expanded=True):
         if st.button("🔄 상태 확인"):
+            # 사용자가 명시적으로 새로고침을 눌렀을 때는 캐시를 비우고 재조회
+            _fetch_agents_cached.clear()
             agents_info = get_available_agents()
             if agents_info:
                 st.session_state.available_agents = agents_info.get("agents", [])
@@ -244,8 +410,17 @@ with st.sidebar:
                         st.rerun()
         else:
             st.write("**현재 세션**")
-            session_info = get_session_info(st.session_state.session_id)
-            
+
+            # rerun(버튼 클릭)마다 HTTP 왕복하지 않도록 마지막 조회 결과를 보관
+            if "last_session_info" not in st.session_state:
+                st.session_state.last_session_info = get_session_info(st.session_state.session_id)
+
+            if st.button("🔄 세션 정보 새로고침"):
+                _fetch_session_info_cached.clear()
+                st.session_state.last_session_info = get_session_info(st.session_state.session_id)
+
+            session_info = st.session_state.last_session_info
+
             if session_info:
                 st.write(f"**에이전트:** {st.session_state.agent_type}")
                 st.write(f"**세션 ID:** `{st.session_state.session_id[:8]}...`")
@@ -257,52 +432,82 @@ with st.sidebar:
             else:
                 st.markdown('<div class="status-box status-error">🔴 세션 정보 없음</div>', unsafe_allow_html=True)
             
-            if st.button("🗑️ 세션 종료"):
+            def _end_session():
+                # 콜백은 스크립트 본문보다 먼저 실행되므로 별도 st.rerun()이 필요 없음
                 if terminate_session(st.session_state.session_id):
                     st.session_state.session_id = None
                     st.session_state.agent_type = None
-                    st.session_state.chat_history = []
-                    st.success("세션이 종료되었습니다.")
-                    st.rerun()
+                    st.session_state.pop("last_session_info", None)
+                    st.session_state.chat_history = {"user": [], "agent": []}
+                    st.toast("세션이 종료되었습니다.")
+
+            st.button("🗑️ 세션 종료", on_click=_end_session)
 
 # 메인 영역 - 채팅 인터페이스
 if st.session_state.session_id:
     st.header(f"💬 {st.session_state.agent_type} 채팅")
-    
+
+    # 콜백에서 적재된 빠른 명령 배치를 히스토리 렌더링 전에 실행
+    # (결과가 같은 실행에서 바로 그려지므로 별도 st.rerun()이 필요 없음)
+    pending_cmds = st.session_state.pop("pending_cmds", None)
+    if pending_cmds:
+        with st.spinner(f"🔄 {st.session_state.agent_type} 실행 중..."):
+            responses = dispatch_commands(st.session_state.session_id, pending_cmds)
+        st.session_state.chat_history["user"].extend(pending_cmds)
+        st.session_state.chat_history["agent"].extend(responses)
+
     # 채팅 히스토리 표시
     chat_container = st.container()
     with chat_container:
-        for i, (user_msg, agent_response) in enumerate(st.session_state.chat_history):
-            with st.expander(f"💬 대화 #{i+1}", expanded=(i == len(st.session_state.chat_history) - 1)):
-                st.markdown(f"**👤 사용자:** {user_msg}")
-                st.markdown(f"**🤖 {st.session_state.agent_type}:**")
-                st.code(agent_response if agent_response else "응답 없음", language="text")
-    
+        # 렌더 루프에서 반복 조회하는 참조를 지역 변수로 바인딩
+        history = st.session_state.chat_history
+        users, agents = history["user"], history["agent"]
+        n = len(users)
+        agent_type = st.session_state.agent_type
+
+        # 최근 항목만 본문까지 즉시 렌더링하고, 오래된 항목은 펼칠 때만 생성
+        # (rerun당 위젯 생성 비용을 O(N)에서 최근 창 크기로 제한)
+        eager_from = max(0, n - 10)
+        for i in range(n):
+            with st.expander(f"💬 대화 #{i+1}", expanded=(i == n - 1)):
+                show_body = i >= eager_from or st.toggle("내용 보기", key=f"open_{i}")
+                if show_body:
+                    st.markdown(f"**👤 사용자:** {users[i]}")
+                    st.markdown(f"**🤖 {agent_type}:**")
+                    st.code(agents[i] if agents[i] else "응답 없음", language="text")
+
+        # 대기 중인 명령은 히스토리 아래에서 도착하는 대로 스트리밍 렌더링
+        pending_msg = st.session_state.pop("pending_user_msg", None)
+        if pending_msg:
+            st.session_state.is_executing = True
+            try:
+                with st.expander(f"💬 대화 #{n + 1}", expanded=True):
+                    st.markdown(f"**👤 사용자:** {pending_msg}")
+                    st.markdown(f"**🤖 {agent_type}:**")
+                    full_response = st.write_stream(
+                        execute_command_stream(st.session_state.session_id, pending_msg)
+                    )
+                users.append(pending_msg)
+                agents.append(full_response if full_response else "✅ 실행 완료 (출력 없음)")
+            finally:
+                st.session_state.is_executing = False
+
     # 명령 입력
     st.markdown("---")
-    
+
     def handle_send_message():
         user_input = st.session_state.get("user_input", "").strip()
-        
+
         # 실행 중 상태 체크
         if st.session_state.get("is_executing", False):
             st.warning("⏳ 이미 실행 중입니다. 잠시 기다려주세요.")
             return
-        
+
         if user_input:
-            st.session_state.is_executing = True
-            try:
-                with st.spinner(f"🔄 {st.session_state.agent_type} 실행 중..."):
-                    # 명령 실행
-                    response = execute_command_sync(st.session_state.session_id, user_input)
-                    
-                    # 채팅 히스토리에 추가
-                    st.session_state.chat_history.append((user_input, response))
-                    
-                    # 입력 필드 초기화
-                    st.session_state.user_input = ""
-            finally:
-                st.session_state.is_executing = False
+            # 실제 실행/렌더링은 채팅 영역에서 스트리밍으로 수행
+            st.session_state.pending_user_msg = user_input
+            # 입력 필드 초기화
+            st.session_state.user_input = ""
 
     user_input = st.text_area(
         "명령을 입력하세요:",
@@ -316,38 +521,21 @@ if st.session_state.session_id:
     with col1:
         st.button("🚀 실행", on_click=handle_send_message, use_container_width=True)
     
+    def _clear_history():
+        st.session_state.chat_history = {"user": [], "agent": []}
+
     with col2:
-        if st.button("🧹 히스토리 지우기", use_container_width=True):
-            st.session_state.chat_history = []
-            st.rerun()
+        st.button("🧹 히스토리 지우기", use_container_width=True, on_click=_clear_history)
     
-    # 빠른 명령 버튼들
+    # 빠른 명령 버튼들 (클릭은 콜백으로 적재만, 실행은 히스토리 렌더링 전에 배치로)
     st.markdown("**빠른 명령:**")
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        if st.button("📁 파일 목록"):
-            response = execute_command_sync(st.session_state.session_id, "현재 디렉토리의 파일과 폴더를 보여주세요")
-            st.session_state.chat_history.append(("현재 디렉토리의 파일과 폴더를 보여주세요", response))
-            st.rerun()
-    
-    with col2:
-        if st.button("📊 시스템 정보"):
-            response = execute_command_sync(st.session_state.session_id, "시스템 정보를 알려주세요")
-            st.session_state.chat_history.append(("시스템 정보를 알려주세요", response))
-            st.rerun()
-    
-    with col3:
-        if st.button("💾 Git 상태"):
-            response = execute_command_sync(st.session_state.session_id, "git status를 확인해주세요")
-            st.session_state.chat_history.append(("git status를 확인해주세요", response))
-            st.rerun()
-    
-    with col4:
-        if st.button("🐍 Python 버전"):
-            response = execute_command_sync(st.session_state.session_id, "Python 버전을 확인해주세요")
-            st.session_state.chat_history.append(("Python 버전을 확인해주세요", response))
-            st.rerun()
+
+    def _queue_quick_cmd(prompt: str):
+        st.session_state.setdefault("pending_cmds", []).append(prompt)
+
+    for (label, prompt), col in zip(_QUICK_CMDS, st.columns(len(_QUICK_CMDS))):
+        with col:
+            st.button(label, on_click=_queue_quick_cmd, args=(prompt,))
 
 else:
     st.info("👈 사이드바에서 세션을 시작하세요.")
@@ -0,0 +1,17 @@
+"""테스트 스크립트 공용 헬퍼"""
+
+async def assert_invalid_inputs_raise(agent, invalid_inputs, method_name='parse_sdk_message'):
+    """잘못된 입력 목록을 메서드에 차례로 넣어 에러 처리를 검증
+
+    각 테스트 파일이 같은 순회/출력 루프를 중복 정의하지 않도록 공용화.
+    파싱이 정상 완료되면 결과 타입을, 예외가 나면 예외를 출력한다.
+    """
+    method = getattr(agent, method_name)
+
+    for i, invalid in enumerate(invalid_inputs, 1):
+        print(f"\n테스트 {i}: {type(invalid)} - {invalid}")
+        try:
+            result = await method(invalid)
+            print(f"✅ 파싱 완료 (타입: {result['type']})")
+        except Exception as e:
+            print(f"❌ 파싱 에러: {e}")